@@ -0,0 +1,142 @@
+"""
+Offline check of the review server's machine translation suggestions (src/suggestions.py):
+persistent cache, de-duplication of concurrent requests, background prefetch, and that
+results stay with their own text when many threads ask at once. Uses StubProvider, and
+GoogleProvider over a fake deep_translator that keeps per-call state on the instance like
+the real one does, so nothing goes over the network.
+
+    python benchmarks/check_suggestions.py
+
+Exits with status 1 if any check fails.
+"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.llm_cache import LLMCache
+from src.suggestions import GoogleProvider, StubProvider, SuggestionService
+
+failures = []
+
+
+def check(name, ok, detail=""):
+    print(f"  {'ok  ' if ok else 'FAIL'} {name}{f'  ({detail})' if detail and not ok else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def in_threads(n, target):
+    threads = [threading.Thread(target=target, args=(i,)) for i in range(n)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def wait_idle(service, timeout=10):
+    deadline = time.monotonic() + timeout
+    while service.stats_snapshot()["in_flight"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def check_cache(cache_path):
+    print("Cache:")
+    provider = StubProvider()
+    service = SuggestionService(provider, cache=LLMCache(cache_path))
+    first = service.suggest("魔剣", "zh-TW")
+    second = service.suggest("魔剣", "zh-TW")
+    check("first call goes to the provider", first == ("[zh-TW] 魔剣", False), first)
+    check("second call is served from the cache", second == ("[zh-TW] 魔剣", True), second)
+    check("provider called once", provider.calls == 1, provider.calls)
+    check("other target language is a separate entry", service.suggest("魔剣", "en")[1] is False)
+
+    restarted = SuggestionService(StubProvider(), cache=LLMCache(cache_path))
+    check("cache survives a restart", restarted.suggest("魔剣", "zh-TW")[1] is True)
+
+
+def check_dedup():
+    print("De-duplication:")
+    provider = StubProvider(delay=0.2)
+    service = SuggestionService(provider)
+    results = [None] * 8
+    in_threads(8, lambda i: results.__setitem__(i, service.suggest("同じ行", "zh-TW")))
+    stats = service.stats_snapshot()
+    check("8 concurrent requests for one text make one provider call", provider.calls == 1, provider.calls)
+    check("all callers get the same result", all(r[0] == "[zh-TW] 同じ行" for r in results), results)
+    check("7 requests counted as deduplicated", stats["deduplicated"] == 7, stats)
+    check("nothing left in flight", stats["in_flight"] == 0, stats)
+
+
+def check_prefetch(cache_path):
+    print("Prefetch:")
+    provider = StubProvider(delay=0.1)
+    service = SuggestionService(provider, cache=LLMCache(cache_path))
+    texts = [f"行{i}" for i in range(60)]
+    counts = service.prefetch(texts + texts[:5] + ["", "  "], "zh-TW")
+    check("duplicates and blank texts are dropped", counts == {"cached": 0, "in_flight": 0, "queued": 60}, counts)
+    # Asked while the prefetch is running: waits for it instead of calling again
+    check("a click during the prefetch shares its request", service.suggest("行59", "zh-TW")[1] is True)
+    wait_idle(service)
+    check("60 texts in batches of 50 make 2 provider calls", provider.calls == 2, provider.calls)
+    again = service.prefetch(texts, "zh-TW")
+    check("prefetching again finds everything cached", again == {"cached": 60, "in_flight": 0, "queued": 0}, again)
+    check("suggestions after a prefetch are cached", all(service.suggest(t, "zh-TW") == (f"[zh-TW] {t}", True)
+                                                         for t in texts))
+
+
+def fake_deep_translator():
+    """Stands in for deep_translator: like GoogleTranslator, translate() keeps the text on the instance."""
+    module = types.ModuleType("deep_translator")
+
+    class GoogleTranslator:
+        def __init__(self, source="auto", target="en"):
+            self.target = target
+            self._url_params = {}
+
+        def translate(self, text):
+            self._url_params["q"] = text
+            time.sleep(0.002)
+            return f"[{self.target}] {self._url_params['q']}"
+
+    module.GoogleTranslator = GoogleTranslator
+    return module
+
+
+def check_threads():
+    print("Concurrent requests for different texts:")
+    sys.modules.setdefault("deep_translator", fake_deep_translator())
+    for provider in (StubProvider(), GoogleProvider()):
+        service = SuggestionService(provider, workers=4)
+        wrong = []
+
+        def ask(i):
+            for j in range(25):
+                text = f"{i}-{j}"
+                value, _ = service.suggest(text, "zh-TW")
+                if value != f"[zh-TW] {text}":
+                    wrong.append((text, value))
+
+        in_threads(8, ask)
+        service.prefetch([f"p{i}" for i in range(40)], "zh-TW")
+        wait_idle(service)
+        check(f"{provider.name}: every result belongs to its own text", not wrong, f"{len(wrong)} mismatched")
+
+
+def main():
+    with tempfile.TemporaryDirectory(prefix="suggestions-check-") as tmp:
+        check_cache(os.path.join(tmp, "suggestions.sqlite3"))
+        check_dedup()
+        check_prefetch(os.path.join(tmp, "prefetch.sqlite3"))
+    check_threads()
+    if failures:
+        print(f"{len(failures)} checks failed")
+        sys.exit(1)
+    print("All suggestion checks passed")
+
+
+if __name__ == "__main__":
+    main()
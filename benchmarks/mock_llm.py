@@ -0,0 +1,250 @@
+"""
+Stand-in OpenAI-compatible chat completions server for running the pipeline without a GPU.
+
+Answers the prompts LLMClient sends (translate_batch JSON, translate_single text,
+term extraction JSON) with pseudo-translations, and simulates a real server's cost
+and misbehaviour:
+  --latency          fixed seconds per request (queueing, prefill)
+  --tokens-per-sec   generation speed; answers take len(answer tokens) / tokens_per_sec longer
+  --failure-rate     share of requests answered with HTTP 500
+  --malformed-rate   share of JSON-mode answers that are cut off (invalid JSON), so
+                     translate_batch's split/retry paths get exercised
+  --max-concurrency  requests beyond this many in flight get 429 with Retry-After
+
+    python benchmarks/mock_llm.py --port 8000 --latency 0.05 --tokens-per-sec 400 --malformed-rate 0.05
+    LLM_API_URL=http://127.0.0.1:8000/v1 python src/main.py prepare --auto-translate ...
+
+GET /stats returns request counters as JSON.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from benchmarks.make_epub import pseudo_translate
+from src.tokens import estimate_tokens
+
+# Katakana runs (optionally joined by ・) look like names to the mock's term extraction
+TERM_RE = re.compile(r'[ァ-ヺー]{3,}(?:・[ァ-ヺー]{2,})*')
+
+
+class MockLLM:
+    def __init__(self, latency=0.05, tokens_per_sec=400.0, failure_rate=0.0, malformed_rate=0.0,
+                 max_concurrency=0, seed=None):
+        self.latency = latency
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self.malformed_rate = malformed_rate
+        self.max_concurrency = max_concurrency
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "completed": 0, "failed": 0, "malformed": 0, "rejected": 0,
+                      "in_flight": 0, "max_in_flight": 0, "prompt_tokens": 0, "completion_tokens": 0}
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def _roll(self, rate):
+        with self.lock:
+            return self.rng.random() < rate
+
+    def answer(self, request):
+        """Content for a chat request, by recognising which LLMClient prompt it is."""
+        messages = request.get("messages", [])
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        user = [m["content"] for m in messages if m["role"] == "user"][-1] if messages else ""
+        json_mode = (request.get("response_format") or {}).get("type") == "json_object"
+
+        if '"translations"' in system:
+            match = re.search(r'Translate these (\d+) lines:\n', user)
+            lines = user[match.end():].split('\n') if match else user.split('\n')
+            count = int(match.group(1)) if match else len(lines)
+            content = json.dumps({"translations": [pseudo_translate(line) for line in lines[:count]]}, ensure_ascii=False)
+        elif '"terms"' in system:
+            # Only the source side carries the names (extract_glossary also sends a reference)
+            source = user.split("Reference (")[0]
+            terms = list(dict.fromkeys(TERM_RE.findall(source)))
+            content = json.dumps({"terms": [{"source": t, "target": pseudo_translate(t)} for t in terms]}, ensure_ascii=False)
+        else:
+            text = user.split("Text:\n", 1)[-1]
+            content = pseudo_translate(text)
+
+        if json_mode and self._roll(self.malformed_rate):
+            with self.lock:
+                self.stats["malformed"] += 1
+            content = content[:max(1, len(content) // 2)]
+        return content
+
+    def begin(self):
+        """Counts a request in; returns False if it is over max_concurrency."""
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.max_concurrency and self.stats["in_flight"] >= self.max_concurrency:
+                self.stats["rejected"] += 1
+                return False
+            self.stats["in_flight"] += 1
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], self.stats["in_flight"])
+            return True
+
+    def end(self, failed=False, prompt_tokens=0, completion_tokens=0):
+        with self.lock:
+            self.stats["in_flight"] -= 1
+            self.stats["failed" if failed else "completed"] += 1
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+
+
+def make_handler(mock):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _json(self, status, payload, headers=None):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path.rstrip('/').endswith("/models"):
+                self._json(200, {"object": "list", "data": [{"id": "mock", "object": "model"}]})
+            elif self.path.rstrip('/').endswith("/stats"):
+                self._json(200, mock.snapshot())
+            else:
+                self._json(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if not self.path.rstrip('/').endswith("/chat/completions"):
+                self._json(404, {"error": {"message": "not found"}})
+                return
+            if not mock.begin():
+                self._json(429, {"error": {"message": "Too many requests"}}, {"Retry-After": "0.2"})
+                return
+            prompt_tokens = sum(estimate_tokens(m.get("content", "")) + 4 for m in request.get("messages", []))
+            try:
+                time.sleep(mock.latency)
+                if mock._roll(mock.failure_rate):
+                    mock.end(failed=True)
+                    self._json(500, {"error": {"message": "Simulated server error"}})
+                    return
+                content = mock.answer(request)
+                completion_tokens = estimate_tokens(content)
+                if request.get("stream"):
+                    self._stream(request, content, prompt_tokens, completion_tokens)
+                else:
+                    if mock.tokens_per_sec:
+                        time.sleep(completion_tokens / mock.tokens_per_sec)
+                    self._json(200, {
+                        "id": "chatcmpl-mock", "object": "chat.completion", "created": int(time.time()),
+                        "model": request.get("model", "mock"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                  "total_tokens": prompt_tokens + completion_tokens},
+                    })
+                mock.end(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+            except (BrokenPipeError, ConnectionResetError):
+                mock.end(failed=True)
+
+        def _stream(self, request, content, prompt_tokens, completion_tokens):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            self.close_connection = True
+            step = 4
+            for i in range(0, len(content), step):
+                piece = content[i:i + step]
+                if mock.tokens_per_sec:
+                    time.sleep(estimate_tokens(piece) / mock.tokens_per_sec)
+                chunk = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": request.get("model", "mock"),
+                         "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            final = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": request.get("model", "mock"),
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode("utf-8"))
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage = {"id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": request.get("model", "mock"), "choices": [],
+                         "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                                   "total_tokens": prompt_tokens + completion_tokens}}
+                self.wfile.write(f"data: {json.dumps(usage)}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+
+    return Handler
+
+
+class MockServer:
+    """Runs a MockLLM on a background thread; port 0 picks a free port."""
+
+    def __init__(self, mock, host="127.0.0.1", port=0):
+        self.mock = mock
+        self.httpd = ThreadingHTTPServer((host, port), make_handler(mock))
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def add_mock_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.05, help="Seconds added to every request")
+    parser.add_argument("--tokens-per-sec", type=float, default=400.0, help="Generation speed (0: instant)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Share of requests answered with HTTP 500")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of JSON answers returned cut off")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="429 beyond this many requests in flight (0: no limit)")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def mock_from_args(args):
+    return MockLLM(latency=args.latency, tokens_per_sec=args.tokens_per_sec, failure_rate=args.failure_rate,
+                   malformed_rate=args.malformed_rate, max_concurrency=args.max_concurrency, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenAI-compatible server for offline benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockServer(mock_from_args(args), args.host, args.port)
+    print(f"Mock LLM listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.mock.snapshot()))
+
+
+if __name__ == "__main__":
+    main()
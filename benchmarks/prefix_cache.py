@@ -0,0 +1,198 @@
+"""
+Measures how well translation prompts reuse vLLM's prefix cache.
+
+Sends the same segments with the previous prompt layout (per-call glossary subset
+inside the prompt) and the current one (stable rules + book glossary first, text last),
+streaming each response to time the first token. Reports prompt tokens per request,
+cached prompt tokens (when the server reports them), time-to-first-token, and the
+average shared prefix between consecutive prompts.
+
+    python benchmarks/prefix_cache.py --input source/40.epub --glossary glossary.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.extraction import extract_book
+from src.glossary_matcher import find_relevant_terms
+from src.llm_client import LLMClient
+from src.segment_packer import SegmentPacker
+from src.tokens import estimate_tokens
+
+
+def legacy_single_messages(text, glossary, src_lang, tgt_lang):
+    """translate_single prompt before the prefix-friendly layout (PROMPT_VERSION 1)."""
+    glossary_str = ""
+    if glossary:
+        relevant = find_relevant_terms(text, glossary)
+        if relevant:
+            glossary_str = f"Glossary:\n{json.dumps(relevant, ensure_ascii=False)}\n"
+    prompt = f"""
+        You are a professional translator. Translate the following {src_lang} text to {tgt_lang}.
+        Output ONLY the translation. Do not include notes or explanations.
+
+        {glossary_str}
+
+        Text:
+        {text}
+        """
+    return [{"role": "user", "content": prompt}]
+
+
+def legacy_batch_messages(texts, glossary, src_lang, tgt_lang):
+    """translate_batch prompt before the prefix-friendly layout (PROMPT_VERSION 1)."""
+    glossary_str = ""
+    if glossary:
+        relevant = find_relevant_terms(texts, glossary)
+        if relevant:
+            glossary_str = f"Glossary:\n{json.dumps(relevant, ensure_ascii=False)}\n"
+    system_msg = f"""You are a professional translator of {src_lang} into {tgt_lang}.
+Rules:
+1. Translate each line maintaining context and flow.
+2. Output a JSON LIST of strings: ["translation1", "translation2"].
+3. Preserve the exact number of lines (N inputs -> N outputs).
+4. Use the glossary if provided.
+"""
+    system_msg += "Output format: { \"translations\": [ \"str1\", \"str2\" ] }"
+    user_content = f"{glossary_str}\nTranslate these {len(texts)} lines:\n"
+    for text in texts:
+        user_content += f"{text}\n"
+    return [{"role": "system", "content": system_msg}, {"role": "user", "content": user_content}]
+
+
+def shared_prefix_tokens(prompts):
+    """Average estimated tokens each prompt shares with the one before it."""
+    shared = []
+    for prev, cur in zip(prompts, prompts[1:]):
+        n = 0
+        for a, b in zip(prev, cur):
+            if a != b:
+                break
+            n += 1
+        shared.append(estimate_tokens(cur[:n]))
+    return statistics.mean(shared) if shared else 0.0
+
+
+def render(messages):
+    # What the chat template sees, close enough to compare prefixes
+    return "".join(f"<{m['role']}>{m['content']}" for m in messages)
+
+
+def reset_prefix_cache(base_url):
+    """vLLM exposes POST /reset_prefix_cache (dev mode); ignore servers without it."""
+    url = base_url.rstrip('/')
+    if url.endswith('/v1'):
+        url = url[:-3]
+    try:
+        urllib.request.urlopen(urllib.request.Request(url + "/reset_prefix_cache", method="POST"), timeout=10)
+        return True
+    except Exception:
+        return False
+
+
+def run_request(llm, messages, max_tokens, json_mode):
+    params = {"temperature": 0.3, "max_tokens": max_tokens, "stream": True,
+              "stream_options": {"include_usage": True}}
+    if json_mode:
+        params["response_format"] = {"type": "json_object"}
+    start = time.perf_counter()
+    ttft = None
+    usage = None
+    for chunk in llm.client.chat.completions.create(model=llm.model, messages=messages, **params):
+        if chunk.choices and chunk.choices[0].delta.content and ttft is None:
+            ttft = time.perf_counter() - start
+        if getattr(chunk, "usage", None):
+            usage = chunk.usage
+    result = {"ttft": ttft, "latency": time.perf_counter() - start,
+              "prompt_tokens": None, "cached_tokens": None}
+    if usage:
+        result["prompt_tokens"] = usage.prompt_tokens
+        details = getattr(usage, "prompt_tokens_details", None)
+        result["cached_tokens"] = getattr(details, "cached_tokens", None) if details else None
+    return result
+
+
+def summarize(results, prompts):
+    def avg(key):
+        values = [r[key] for r in results if r[key] is not None]
+        return statistics.mean(values) if values else None
+
+    def p50(key):
+        values = [r[key] for r in results if r[key] is not None]
+        return statistics.median(values) if values else None
+
+    return {
+        "requests": len(results),
+        "prompt_tokens_avg": avg("prompt_tokens"),
+        "cached_tokens_avg": avg("cached_tokens"),
+        "ttft_avg": avg("ttft"),
+        "ttft_p50": p50("ttft"),
+        "latency_avg": avg("latency"),
+        "shared_prefix_tokens_est": shared_prefix_tokens(prompts),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prefix cache benchmark: previous vs current prompt layout')
+    parser.add_argument('--input', required=True, help='EPUB to take segments from')
+    parser.add_argument('--glossary', default='glossary.json', help='Glossary JSON')
+    parser.add_argument('--mode', choices=['single', 'batch'], default='single', help='translate_single or translate_batch prompts')
+    parser.add_argument('--segments', type=int, default=200, help='Number of segments to send')
+    parser.add_argument('--concurrency', type=int, default=int(os.getenv('LLM_CONCURRENCY', '8')))
+    parser.add_argument('--max-tokens', type=int, default=64, help='Completion limit; small, only the prompt side is measured')
+    parser.add_argument('--model', default=os.getenv('LLM_MODEL', 'Qwen/Qwen2.5-7B-Instruct'))
+    parser.add_argument('--src-lang', default='Japanese')
+    parser.add_argument('--tgt-lang', default='Traditional Chinese')
+    parser.add_argument('--json', help='Write results to this file')
+    args = parser.parse_args()
+
+    llm = LLMClient(model=args.model, cache=False)
+    glossary = {}
+    if os.path.exists(args.glossary):
+        with open(args.glossary, 'r', encoding='utf-8') as f:
+            glossary = json.load(f)
+    segments = [{"id": str(i), "chapter": c["name"], "jp": text}
+                for c in extract_book(args.input) if 'p-' in c["name"]
+                for i, text in enumerate(c["segments"])][:args.segments]
+    if args.mode == 'batch':
+        units = [[seg["jp"] for seg in batch] for batch in SegmentPacker(count_tokens=llm.tokens.count).pack(segments)[0]]
+    else:
+        units = [seg["jp"] for seg in segments]
+
+    layouts = {
+        "previous": legacy_batch_messages if args.mode == 'batch' else legacy_single_messages,
+        "current": llm._batch_messages if args.mode == 'batch' else llm._single_messages,
+    }
+    print(f"{len(units)} {args.mode} requests per layout, {len(glossary)} glossary terms, concurrency {args.concurrency}")
+
+    report = {"mode": args.mode, "segments": len(segments), "glossary_terms": len(glossary), "layouts": {}}
+    for name, build in layouts.items():
+        messages = [build(unit, glossary, args.src_lang, args.tgt_lang) for unit in units]
+        if not reset_prefix_cache(str(llm.client.base_url)):
+            print("(could not reset the server's prefix cache; results may include warm entries)")
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            results = list(pool.map(lambda m: run_request(llm, m, args.max_tokens, args.mode == 'batch'), messages))
+        report["layouts"][name] = summarize(results, [render(m) for m in messages])
+
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "n/a".rjust(int(spec.split('.')[0]))
+
+    print(f"{'layout':<10} {'prompt tok':>10} {'cached tok':>10} {'shared est':>10} {'ttft avg':>9} {'ttft p50':>9}")
+    for name, r in report["layouts"].items():
+        print(f"{name:<10} {fmt(r['prompt_tokens_avg'], '10.1f')} {fmt(r['cached_tokens_avg'], '10.1f')} "
+              f"{r['shared_prefix_tokens_est']:10.1f} {fmt(r['ttft_avg'], '9.3f')} {fmt(r['ttft_p50'], '9.3f')}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,240 @@
+"""
+Offline end-to-end benchmark: synthetic EPUBs + mock LLM server, no GPU needed.
+
+Generates a source volume and a pseudo-translated reference (make_epub.py), starts the
+mock OpenAI-compatible server (mock_llm.py) in this process, then times each pipeline
+step as the CLI runs it (align, extract-glossary, prepare --auto-translate, export) and
+the review server's routes through Flask's test client. Results go to stdout and, with
+--json, to a file; --baseline compares against an earlier result file and lists what
+got slower.
+
+    python benchmarks/run.py --chapters 10 --paragraphs 200 --json bench.json
+    python benchmarks/run.py --chapters 10 --paragraphs 200 --baseline bench.json --fail-on-regression
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.append(ROOT)
+from benchmarks.make_epub import make_chapters, reference_chapters, write_epub
+from benchmarks.mock_llm import MockServer, add_mock_arguments, mock_from_args
+
+STAGES = ["align", "extract-glossary", "prepare", "export", "routes"]
+
+
+def run_stage(name, argv, env, mock):
+    """Runs one `src/main.py` command; returns its timing and the LLM requests it made."""
+    before = mock.snapshot()
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, os.path.join(ROOT, "src", "main.py")] + argv, env=env, cwd=ROOT,
+                          capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    after = mock.snapshot()
+    result = {
+        "seconds": round(seconds, 3),
+        "ok": proc.returncode == 0,
+        "llm": {key: after[key] - before[key] for key in
+                ("requests", "completed", "failed", "malformed", "rejected", "prompt_tokens", "completion_tokens")},
+    }
+    if proc.returncode != 0:
+        result["error"] = (proc.stderr or proc.stdout).strip().splitlines()[-5:]
+    print(f"  {name:<17} {seconds:8.2f}s  {result['llm']['requests']:5d} LLM requests"
+          f"{'' if result['ok'] else '  FAILED'}")
+    return result
+
+
+def percentile(values, q):
+    values = sorted(values)
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+def time_requests(call, n):
+    timings = []
+    status = None
+    for i in range(n):
+        start = time.perf_counter()
+        response = call(i)
+        # Streamed bodies are read here, so their time counts
+        response.get_data()
+        timings.append((time.perf_counter() - start) * 1000)
+        status = response.status_code
+    return {
+        "n": n,
+        "status": status,
+        "mean_ms": round(statistics.mean(timings), 3),
+        "p50_ms": round(percentile(timings, 0.5), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "max_ms": round(max(timings), 3),
+    }
+
+
+def bench_routes(work_dir, n, n_llm):
+    """Times the review server's routes in this process against the prepared session."""
+    from src import server
+    server.WORK_DIR = work_dir
+    client = server.app.test_client()
+    manager = server.get_manager()
+    chapters = manager.list_chapters()
+    chapter = chapters[0]["chapter"]
+    total = sum(c["total"] for c in chapters)
+    segments, _ = manager.list_segments(limit=max(n, n_llm) * 3)
+    ids = [seg["id"] for seg in segments]
+
+    def segments_page(i):
+        # Walk the whole book page by page
+        return client.get(f"/api/segments?cursor={(i * 50) % total}&limit=50")
+
+    routes = {
+        "GET /api/session/summary": (lambda i: client.get("/api/session/summary"), n),
+        "GET /api/chapters": (lambda i: client.get("/api/chapters"), n),
+        "GET /api/segments": (segments_page, n),
+        "GET /api/segments?chapter": (lambda i: client.get("/api/segments", query_string={"chapter": chapter, "limit": 500}), n),
+        "GET /api/glossary": (lambda i: client.get("/api/glossary"), n),
+        "POST /api/segment/<id>": (lambda i: client.post(f"/api/segment/{ids[i % len(ids)]}", json={"zh": f"edit {i}"}), n),
+        "POST /api/translate/<id>": (lambda i: client.post(f"/api/translate/{ids[i % len(ids)]}"), n_llm),
+        "POST /api/translate/<id>/stream": (lambda i: client.post(f"/api/translate/{ids[-1 - i % len(ids)]}/stream"), n_llm),
+        "GET /metrics": (lambda i: client.get("/metrics"), n),
+        "GET /api/session": (lambda i: client.get("/api/session"), max(1, n // 10)),
+    }
+    results = {}
+    for name, (call, count) in routes.items():
+        results[name] = time_requests(call, count)
+        r = results[name]
+        print(f"  {name:<32} p50 {r['p50_ms']:8.2f} ms  p95 {r['p95_ms']:8.2f} ms  (n={count}, HTTP {r['status']})")
+    return results
+
+
+def compare(report, baseline, tolerance):
+    """Entries that got slower than baseline by more than tolerance (a fraction)."""
+    regressions = []
+    for name, stage in report["stages"].items():
+        old = baseline.get("stages", {}).get(name)
+        if old and old.get("seconds") and stage.get("seconds") and stage["seconds"] > old["seconds"] * (1 + tolerance):
+            regressions.append((f"stage {name}", old["seconds"], stage["seconds"], "s"))
+    for name, route in report.get("routes", {}).items():
+        old = baseline.get("routes", {}).get(name)
+        # Sub-millisecond routes are mostly noise
+        if old and route["p50_ms"] > max(1.0, old["p50_ms"] * (1 + tolerance)):
+            regressions.append((f"route {name} p50", old["p50_ms"], route["p50_ms"], "ms"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline pipeline benchmark with synthetic EPUBs and a mock LLM server")
+    parser.add_argument("--chapters", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=200, help="Average paragraphs per chapter")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {','.join(STAGES)}")
+    parser.add_argument("--concurrency", type=int, default=8, help="--concurrency passed to the pipeline commands")
+    parser.add_argument("--no-batch", action="store_true", help="prepare --no-batch (one request per segment)")
+    parser.add_argument("--route-requests", type=int, default=200, help="Requests per review server route")
+    parser.add_argument("--route-llm-requests", type=int, default=20, help="Requests per route that calls the LLM")
+    parser.add_argument("--work-dir", help="Keep generated files here (default: a temporary directory)")
+    parser.add_argument("--json", help="Write results to this file")
+    parser.add_argument("--baseline", help="Earlier --json result to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown vs baseline reported as a regression (0.2 = 20%%)")
+    parser.add_argument("--fail-on-regression", action="store_true", help="Exit with status 1 if anything regressed")
+    add_mock_arguments(parser)
+    args = parser.parse_args()
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+
+    tmp = None
+    if args.work_dir:
+        os.makedirs(args.work_dir, exist_ok=True)
+        base = os.path.abspath(args.work_dir)
+    else:
+        tmp = tempfile.TemporaryDirectory(prefix="epub-bench-")
+        base = tmp.name
+    source = os.path.join(base, "source.epub")
+    reference = os.path.join(base, "reference.epub")
+    glossary = os.path.join(base, "glossary.json")
+    session_dir = os.path.join(base, "session")
+    output = os.path.join(base, "output.epub")
+
+    chapters = make_chapters(args.chapters, args.paragraphs, args.seed)
+    write_epub(source, chapters, lang="ja", seed=args.seed)
+    write_epub(reference, reference_chapters(chapters, args.seed), lang="zh", seed=args.seed)
+    segments = sum(len(p) for _, p in chapters)
+    print(f"Synthetic volume: {len(chapters)} chapters, {segments} paragraphs, "
+          f"{sum(len(t) for _, p in chapters for t in p)} characters")
+
+    server = MockServer(mock_from_args(args)).start()
+    # Measure the pipeline, not the response cache
+    env = dict(os.environ, LLM_API_URL=server.url, LLM_API_KEY="sk-mock", LLM_CACHE="off", PYTHONUNBUFFERED="1")
+    os.environ.update(LLM_API_URL=server.url, LLM_API_KEY="sk-mock", LLM_CACHE="off")
+    print(f"Mock LLM at {server.url} (latency {args.latency}s, {args.tokens_per_sec} tok/s, "
+          f"failures {args.failure_rate:.0%}, malformed JSON {args.malformed_rate:.0%})")
+
+    concurrency = ["--concurrency", str(args.concurrency)]
+    commands = {
+        "align": ["align", "--source", source, "--reference", reference, "--out", glossary] + concurrency,
+        "extract-glossary": ["extract-glossary", "--input", source, "--base_glossary", glossary] + concurrency,
+        "prepare": ["prepare", "--input", source, "--glossary", glossary, "--work-dir", session_dir,
+                    "--auto-translate"] + concurrency + (["--no-batch"] if args.no_batch else []),
+        "export": ["export", "--input", source, "--output", output, "--work-dir", session_dir, "--full-rebuild"],
+    }
+
+    report = {
+        "version": 1,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {key: getattr(args, key) for key in
+                   ("chapters", "paragraphs", "seed", "concurrency", "no_batch", "latency", "tokens_per_sec",
+                    "failure_rate", "malformed_rate", "max_concurrency")},
+        "book": {"chapters": len(chapters), "segments": segments},
+        "stages": {},
+    }
+    try:
+        print("Pipeline:")
+        for name in stages:
+            if name in commands:
+                report["stages"][name] = run_stage(name, commands[name], env, server.mock)
+                if name == "prepare" and report["stages"][name]["ok"]:
+                    report["stages"][name]["segments_per_sec"] = round(segments / report["stages"][name]["seconds"], 1)
+        if "routes" in stages:
+            if os.path.exists(os.path.join(session_dir, "session.db")):
+                print("Review server routes:")
+                report["routes"] = bench_routes(session_dir, args.route_requests, args.route_llm_requests)
+            else:
+                print("Skipping routes: no session (run the prepare stage too)")
+    finally:
+        report["mock"] = server.mock.snapshot()
+        server.stop()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+        print(f"Results written to {args.json}")
+
+    failed = [name for name, stage in report["stages"].items() if not stage["ok"]]
+    for name in failed:
+        print(f"Stage {name} failed:\n  " + "\n  ".join(report["stages"][name].get("error", [])))
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions (more than {args.tolerance:.0%} slower than {args.baseline}):")
+            for name, old, new, unit in regressions:
+                print(f"  {name}: {old:.2f}{unit} -> {new:.2f}{unit} ({new / old - 1:+.0%})")
+        else:
+            print(f"No regressions against {args.baseline}")
+
+    if tmp:
+        tmp.cleanup()
+    if failed or (regressions and args.fail_on_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,132 +1,124 @@
 import json
 import re
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
 from tqdm import tqdm
-from src.epub_handler import load_epub, get_chapter_items, extract_text_from_html
+from src.extraction import extract_book
+from src.sequence_align import align_sequences, aligned_windows, confidence, length_ratio, profile
+from src.term_extraction import TermVotes, is_valid_term, parse_terms_json, print_vote_summary
 from src.llm_client import LLMClient
 
 class Aligner:
     def __init__(self, source_path, ref_path, llm_client=None):
-        self.source_book = load_epub(source_path)
-        self.ref_book = load_epub(ref_path)
+        self.source_chapters = extract_book(source_path)
+        self.ref_chapters = extract_book(ref_path)
         self.llm = llm_client
 
-    def align_chapters(self):
-        """Coarse alignment of file-to-file."""
-        source_items = sorted([i for i in get_chapter_items(self.source_book) if 'xhtml/p-' in i.get_name()], key=lambda x: x.get_name())
-        # Generic heuristic: usually 'xhtml/p-' or 'text/' etc. For now we assume typical structure.
-        # If generic, might need broader filter, but let's stick to what works for now (p-*)
-        ref_items = sorted([i for i in get_chapter_items(self.ref_book) if 'p-' in i.get_name()], key=lambda x: x.get_name())
-
+    def align_chapters(self, min_confidence=0.6, max_chars=1500):
+        """
+        Aligns the two books at chapter level, then at paragraph level inside each chapter pair,
+        and returns high-confidence parallel windows (up to max_chars source characters each)
+        from the whole book. A missing or split chapter on either side only affects that chapter.
+        """
         pairs = []
         
         # Helper to get valid content chapters
-        def get_valid_chapters(items):
+        def get_valid_chapters(chapters):
             valid = []
-            for item in items:
+            for chapter in chapters:
                 # heuristic: must have 'p-' in name (common for LN epubs)
-                if 'p-' not in item.get_name(): continue
-                text = extract_text_from_html(item.get_content())
-                lines = [l for l in text.split('\n') if l.strip()]
-                # content must be significant (> 50 lines) to be a story chapter
-                if len(lines) > 50:
-                    valid.append((item, text, len(lines)))
+                if 'p-' not in chapter["name"]: continue
+                # skip near-empty pages (illustrations, titles); the aligner skips other extras itself
+                if chapter["line_count"] >= 10:
+                    valid.append(chapter)
             # Sort by filename to ensure sequence
-            valid.sort(key=lambda x: x[0].get_name())
+            valid.sort(key=lambda c: c["name"])
             return valid
 
         print("Analyzing chapters for alignment...")
-        source_valid = get_valid_chapters(get_chapter_items(self.source_book))
-        ref_valid = get_valid_chapters(get_chapter_items(self.ref_book))
+        source_valid = get_valid_chapters(self.source_chapters)
+        ref_valid = get_valid_chapters(self.ref_chapters)
+
+        print(f"Found {len(source_valid)} Source chapters and {len(ref_valid)} Ref chapters.")
+        if not source_valid or not ref_valid:
+            return pairs
+
+        source_paras = [[l for l in c["text"].split('\n') if l.strip()] for c in source_valid]
+        ref_paras = [[l for l in c["text"].split('\n') if l.strip()] for c in ref_valid]
 
-        print(f"Found {len(source_valid)} significant Source chapters and {len(ref_valid)} significant Ref chapters.")
+        # Chapter level: whole-chapter length and punctuation profiles, with skips for chapters
+        # that only exist on one side and 2-1 / 1-2 links for chapters split differently
+        src_feats = np.array([profile(p).sum(axis=0) for p in source_paras])
+        ref_feats = np.array([profile(p).sum(axis=0) for p in ref_paras])
+        ratio = length_ratio(src_feats, ref_feats)
+        links = align_sequences(src_feats, ref_feats, ratio=ratio, skip_cost=1.0, merge_cost=1.0)
 
-        # Align index-by-index
-        min_len = min(len(source_valid), len(ref_valid))
-        for k in range(min_len):
-            src_item, src_text, src_lines = source_valid[k]
-            ref_item, ref_text, ref_lines = ref_valid[k]
-            
-            # Sanity check: lengths should be roughly similar (within 50% different is generous but safe)
-            # e.g. 458 vs 462 is close. 1456 vs 1468 is close.
-            ratio = min(src_lines, ref_lines) / max(src_lines, ref_lines)
-            if ratio < 0.5:
-                print(f"Skipping alignment mismatch: {src_item.get_name()} ({src_lines}L) vs {ref_item.get_name()} ({ref_lines}L)")
+        for src_idx, ref_idx, move, cost in links:
+            if not src_idx or not ref_idx:
+                side = source_valid[src_idx[0]] if src_idx else ref_valid[ref_idx[0]]
+                print(f"Unmatched: {side['name']} ({side['line_count']}L)")
+                continue
+            src_name = "+".join(source_valid[k]["name"] for k in src_idx)
+            ref_name = "+".join(ref_valid[k]["name"] for k in ref_idx)
+            src_lines = sum(source_valid[k]["line_count"] for k in src_idx)
+            ref_lines = sum(ref_valid[k]["line_count"] for k in ref_idx)
+            if confidence(cost) < 0.5:
+                print(f"Skipping alignment mismatch: {src_name} ({src_lines}L) vs {ref_name} ({ref_lines}L)")
                 continue
 
-            print(f"Aligned: {src_item.get_name()} ({src_lines}L) <-> {ref_item.get_name()} ({ref_lines}L)")
-            pairs.append({
-                "source_id": src_item.get_name(),
-                "ref_id": ref_item.get_name(),
-                "source_text": src_text[:3000], 
-                "ref_text": ref_text[:3000]
-            })
+            # Paragraph level: only verified parallel windows go to the LLM
+            windows = aligned_windows(
+                [l for k in src_idx for l in source_paras[k]],
+                [l for k in ref_idx for l in ref_paras[k]],
+                min_confidence=min_confidence, max_chars=max_chars, ratio=ratio)
+            covered = sum(len(w["source_text"]) + 1 for w in windows)
+            total = sum(len(l) + 1 for k in src_idx for l in source_paras[k])
+            print(f"Aligned: {src_name} ({src_lines}L) <-> {ref_name} ({ref_lines}L), "
+                  f"{len(windows)} windows, {covered / total:.0%} of text")
+            for w in windows:
+                pairs.append({
+                    "source_id": src_name,
+                    "ref_id": ref_name,
+                    "source_text": w["source_text"],
+                    "ref_text": w["ref_text"],
+                    "confidence": w["confidence"],
+                })
         
-        print(f"DEBUG: Found {len(pairs)} aligned pairs.")
+        print(f"DEBUG: Found {len(pairs)} aligned windows.")
         return pairs
 
-    def extract_glossary_from_pairs(self, pairs, src_lang="Japanese", tgt_lang="Traditional Chinese"):
-        """Uses LLM to extract glossary from aligned chapters."""
-        full_glossary = {}
-        
+    def extract_glossary_from_pairs(self, pairs, src_lang="Japanese", tgt_lang="Traditional Chinese", concurrency=1, min_votes=1):
+        """
+        Uses LLM to extract glossary from aligned windows, several requests at a time.
+        Each term keeps the target proposed by the most windows.
+        """
         print("Extracting glossary terms from aligned chapters...")
-        # Process all pairs now that we have better alignment
-        for pair in tqdm(pairs): 
+
+        def scan(pair):
             glossary_json = self.llm.extract_glossary(pair['source_text'], pair['ref_text'], src_lang, tgt_lang)
             try:
-                data = json.loads(glossary_json)
-                
-                batch_terms = {}
-                
-                # Helper to normalize keys
-                def get_kv(item):
-                    k = item.get("source") or item.get("jp") or item.get("gloss_term_jp") or item.get("Japanese")
-                    v = item.get("target") or item.get("zh") or item.get("gloss_term_zh") or item.get("Chinese")
-                    return k, v
+                terms = parse_terms_json(glossary_json, src_lang, tgt_lang)
+            except Exception:
+                return []
+            # Key must exist in the source text it was extracted from
+            return [(k, v) for k, v in terms if is_valid_term(k, pair['source_text'])]
 
-                # Case 1: Standard "terms" list
-                if "terms" in data and isinstance(data["terms"], list):
-                    for item in data["terms"]:
-                         k, v = get_kv(item)
-                         if k and v: batch_terms[k] = v
-                         
-                # Case 2: "glossary_terms" list (observed in wild)
-                elif "glossary_terms" in data and isinstance(data["glossary_terms"], list):
-                    for item in data["glossary_terms"]:
-                         k, v = get_kv(item)
-                         if k and v: batch_terms[k] = v
-                         
-                # Case 3: Flat dictionary (Fallback)
-                elif isinstance(data, dict):
-                     for k, v in data.items():
-                         # BLOCK lists/dicts to prevent pollution
-                         if k not in ["terms", "glossary_terms"] and isinstance(v, str):
-                             batch_terms[k] = v
+        concurrency = max(1, int(concurrency or 1))
+        results = [None] * len(pairs)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(scan, pair): i for i, pair in enumerate(pairs)}
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"Glossary Extraction Error: {e}")
 
-                if batch_terms:
-                    # Filter invalid terms
-                    valid_batch = {}
-                    for k, v in batch_terms.items():
-                        # Rule 1: Key must exist in original text
-                        if k not in pair['source_text']: continue
-                        
-                        # Rule 2: Length checks
-                        if len(k) > 20 or len(k) <= 1: continue
-                        
-                        # Rule 3: Common Noun/Symbol Blocklist (Python side is more reliable than Prompt)
-                        # Identify common false positives seen in logs
-                        blocklist = ["村", "町", "道", "街", "都市", "王国", "帝国", "世界", "人間", "彼", "彼女", "自分", 
-                                     "今日", "昨日", "明日", "時間", "場所", "理由", "意味", "言葉", "名前", "ピラミッド", "ミイラ"]
-                        if k in blocklist: continue
-                        
-                        # Rule 4: Value sanity check (should contain some CJK usually, not just English if input was JP)
-                        
-                        valid_batch[k] = v
-                        
-                    full_glossary.update(valid_batch)
-            except:
-                pass
-                
-        return full_glossary
+        # Votes are counted in book order, so ties resolve the same way on every run
+        votes = TermVotes()
+        for terms in results:
+            votes.add(terms or [])
+        print_vote_summary(votes)
+        return votes.glossary(min_votes=min_votes)
 
     def save_glossary(self, glossary, output_path):
         with open(output_path, 'w', encoding='utf-8') as f:
@@ -0,0 +1,255 @@
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from src.extraction import extract_book
+from src.glossary_matcher import glossary_changed
+from src.review_manager import ReviewManager
+from src.segment_packer import SegmentPacker, format_pack_stats
+from src.term_extraction import TermVotes, print_vote_summary
+from src.translator import SessionCheckpoint, Translator
+
+
+def natural_key(name):
+    """Sort key that puts "vol2" before "vol10"."""
+    return [int(part) if part.isdigit() else part.lower() for part in re.split(r'(\d+)', name)]
+
+
+def find_volumes(input_dir):
+    """EPUB files directly in input_dir, in natural (volume) order."""
+    names = [n for n in os.listdir(input_dir) if n.lower().endswith('.epub') and not n.startswith('.')]
+    return [os.path.join(input_dir, n) for n in sorted(names, key=natural_key)]
+
+
+class Volume:
+    """State of one volume in a series run."""
+
+    def __init__(self, path, work_root):
+        self.path = path
+        self.name = os.path.splitext(os.path.basename(path))[0]
+        self.work_dir = os.path.join(work_root, self.name)
+        self.manager = None
+        self.error = None
+        self.term_futures = []
+        self.new_terms = 0
+        self.glossary = None        # glossary snapshot this volume is translated with
+        self.checkpoint = None
+        self.remaining = 0          # translation batches not finished yet
+        self.segments = 0
+        self.translated = 0
+        self.started = None
+        self.seconds = None
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+
+
+class SeriesBatch:
+    """
+    Runs extract -> prepare -> auto-translate over the volumes of a series on one
+    shared worker pool (sized to the LLM client's total concurrency), so requests
+    keep flowing across volume boundaries instead of draining at the end of each book.
+
+    - Term extraction of volume N+1 is queued ahead of the translation batches of
+      volume N, so its glossary is settled (and its own batches queued) while N is still
+      translating; the pool does not drain at volume boundaries.
+    - The glossary grows volume by volume and is saved after every extraction: terms
+      found in a volume are added to it (known terms keep their first translation),
+      and each volume is translated with a snapshot of the glossary at that point.
+    - Each volume gets a session in <work_root>/<volume name>; translations are
+      checkpointed into it as they arrive. Re-running the same command resumes:
+      volumes whose terms were already extracted skip extraction, and only
+      untranslated segments are sent again.
+    """
+
+    def __init__(self, llm, glossary_path, work_root, src_lang="Japanese", tgt_lang="Traditional Chinese",
+                 extract=True, batch=True, window_chars=2500, min_votes=1, workers=None):
+        self.llm = llm
+        self.translator = Translator(llm, glossary_path)
+        self.work_root = work_root
+        self.src_lang = src_lang
+        self.tgt_lang = tgt_lang
+        self.extract = extract
+        self.batch = batch
+        self.window_chars = window_chars
+        self.min_votes = min_votes
+        self.workers = workers or llm.max_concurrency
+        self.packer = SegmentPacker(max_model_len=llm.max_model_len, count_tokens=llm.tokens.count)
+        self.pool = None
+
+    def run(self, paths):
+        """Processes the volumes in order; returns their Volume records."""
+        os.makedirs(self.work_root, exist_ok=True)
+        volumes = [Volume(path, self.work_root) for path in paths]
+        print(f"Series batch: {len(volumes)} volumes, {self.workers} workers, glossary {self.translator.glossary_path} "
+              f"({len(self.translator.glossary)} terms)")
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="series") as pool:
+            self.pool = pool
+            if volumes:
+                self._open(volumes[0])
+                self._start_extract(volumes[0])
+            for i, volume in enumerate(volumes):
+                # Returns once this volume's windows are done; they were queued ahead of the
+                # previous volume's batches, which keep the workers busy meanwhile
+                self._finish_extract(volume)
+                if i + 1 < len(volumes):
+                    # Next volume's windows go ahead of this volume's batches (see class docstring);
+                    # its terms are scanned against a glossary that already has this volume's
+                    self._open(volumes[i + 1])
+                    self._start_extract(volumes[i + 1])
+                self._start_translate(volume)
+            for volume in volumes:
+                volume.done.wait()
+        self.pool = None
+        self._print_summary(volumes, time.monotonic() - start)
+        return volumes
+
+    def _open(self, volume):
+        """Creates the volume's session, or reopens it to resume."""
+        try:
+            self.translator.prepare_review_session(volume.path, volume.work_dir, self.src_lang, self.tgt_lang, resume=True)
+            volume.manager = ReviewManager(volume.work_dir)
+        except Exception as e:
+            self._fail(volume, f"prepare failed: {e}")
+
+    def _start_extract(self, volume):
+        if volume.error or not self.extract:
+            return
+        try:
+            if volume.manager.get_meta("series_terms_extracted"):
+                return
+            windows = self.translator.term_windows(extract_book(volume.path), self.window_chars)
+        except Exception as e:
+            self._fail(volume, f"term extraction failed: {e}")
+            return
+        print(f"[{volume.name}] Queued {len(windows)} term extraction windows")
+        volume.term_futures = [self.pool.submit(self.translator.scan_terms, w, self.src_lang, self.tgt_lang)
+                               for w in windows]
+
+    def _finish_extract(self, volume):
+        # A failure here only stops this volume; the others carry on
+        try:
+            self._merge_terms(volume)
+        except Exception as e:
+            self._fail(volume, f"term extraction failed: {e}")
+
+    def _merge_terms(self, volume):
+        if volume.error:
+            return
+        if volume.term_futures:
+            wait(volume.term_futures)
+            # Votes are counted in book order, so ties resolve the same way on every run
+            votes = TermVotes()
+            for future in volume.term_futures:
+                try:
+                    votes.add(future.result())
+                except Exception as e:
+                    print(f"[{volume.name}] Term Extraction Error: {e}")
+            volume.term_futures = []
+            print_vote_summary(votes)
+            glossary = self.translator.glossary
+            new_terms = {k: v for k, v in votes.glossary(min_votes=self.min_votes).items() if k not in glossary}
+            volume.new_terms = len(new_terms)
+            if new_terms:
+                glossary.update(new_terms)
+                glossary_changed(glossary)
+                self._save_glossary()
+            print(f"[{volume.name}] {len(new_terms)} new terms, glossary now {len(glossary)} terms")
+            volume.manager.set_meta("series_terms_extracted", True)
+        # Sessions store the glossary they were translated with, for the review UI
+        volume.glossary = dict(self.translator.glossary)
+        volume.manager.set_glossary(volume.glossary)
+
+    def _save_glossary(self):
+        path = self.translator.glossary_path
+        if not path:
+            return
+        # Written whole and then renamed, so an interrupted run never leaves a truncated glossary
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.translator.glossary, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
+
+    def _start_translate(self, volume):
+        if volume.error:
+            volume.done.set()
+            return
+        try:
+            segments = volume.manager.get_all_segments()
+            pending = [seg for seg in segments if not seg["zh"] and seg["status"] != "approved"]
+            volume.segments = len(segments)
+            volume.started = time.monotonic()
+            print(f"[{volume.name}] Translating {len(pending)} of {len(segments)} segments")
+            if not pending:
+                batches = []
+            elif self.batch:
+                batches, stats = self.packer.pack(pending)
+                print(f"[{volume.name}] {format_pack_stats(stats)}")
+            else:
+                batches = [[seg] for seg in pending]
+        except Exception as e:
+            self._fail(volume, f"translation failed to start: {e}")
+            volume.done.set()
+            return
+        if not batches:
+            self._finish_translate(volume)
+            return
+        volume.checkpoint = SessionCheckpoint(volume.manager)
+        volume.remaining = len(batches)
+        for batch in batches:
+            future = self.pool.submit(self.translator.translate_pack, batch, self.src_lang, self.tgt_lang, volume.glossary)
+            future.add_done_callback(lambda f, batch=batch: self._batch_done(volume, batch, f))
+
+    def _batch_done(self, volume, batch, future):
+        # Runs as a done-callback, where exceptions are only logged: whatever happens,
+        # the batch must be counted so the volume can finish and run() does not hang
+        try:
+            try:
+                results = future.result()
+            except Exception as e:
+                print(f"[{volume.name}] Error translating batch starting at segment {batch[0]['id']}: {e}")
+                results = None
+            done = self.translator.apply_translations(batch, results)
+            with volume.lock:
+                if done:
+                    volume.checkpoint.add(done)
+                volume.translated += len(done)
+        except Exception as e:
+            self._fail(volume, f"saving translations failed: {e}")
+        finally:
+            with volume.lock:
+                volume.remaining -= 1
+                last = volume.remaining == 0
+        if last:
+            self._finish_translate(volume)
+
+    def _finish_translate(self, volume):
+        try:
+            if volume.checkpoint:
+                with volume.lock:
+                    volume.checkpoint.flush()
+            volume.seconds = time.monotonic() - volume.started
+            left = sum(1 for seg in volume.manager.get_all_segments() if not seg["zh"])
+            print(f"[{volume.name}] Done: {volume.translated} segments translated in {volume.seconds:.1f}s, "
+                  f"{left} still untranslated")
+        except Exception as e:
+            self._fail(volume, f"saving translations failed: {e}")
+        finally:
+            volume.done.set()
+
+    @staticmethod
+    def _fail(volume, error):
+        """Records the first error of a volume; the summary shows it as the volume's status."""
+        with volume.lock:
+            volume.error = volume.error or error
+        print(f"[{volume.name}] {error}")
+
+    @staticmethod
+    def _print_summary(volumes, seconds):
+        print(f"Series batch finished in {seconds:.1f}s")
+        print(f"{'volume':<30} {'segments':>8} {'translated':>10} {'new terms':>9}  status")
+        for v in volumes:
+            status = v.error or (f"{v.seconds:.1f}s" if v.seconds is not None else "")
+            print(f"{v.name[:30]:<30} {v.segments:>8} {v.translated:>10} {v.new_terms:>9}  {status}")
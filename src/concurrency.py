@@ -0,0 +1,143 @@
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+
+class AdaptiveLimiter:
+    """
+    AIMD limit on the number of LLM requests in flight.
+
+    - Additive increase: after a full window of successful requests (as many as the
+      current limit) the limit grows by one, up to max_limit.
+    - Multiplicative decrease: an overload signal (429/503, timeout, connection error)
+      halves the limit; latency rising well above the best latency seen lowers it by
+      a tenth. Decreases happen at most once per latency period, so a burst of
+      failures from one wave of requests counts once.
+    - Retry-After: pause() stops new requests from starting until the given time.
+
+    Callers take a slot with try_acquire() and give it back with release(); waiting for
+    a free slot is up to the caller (EndpointPool waits across all its endpoints).
+    """
+
+    def __init__(self, max_limit=8, initial=None, min_limit=1, latency_tolerance=2.0):
+        self.max_limit = max(1, int(max_limit))
+        self.min_limit = max(1, min(int(min_limit), self.max_limit))
+        self.limit = float(min(self.max_limit, initial or self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.successes = 0
+        self.latency_ema = None
+        self.latency_floor = None
+        self.last_decrease = 0.0
+        # Counters
+        self.overloads = 0
+        self.increases = 0
+        self.decreases = 0
+        self._cond = threading.Condition()
+
+    def set_max(self, max_limit):
+        with self._cond:
+            self.max_limit = max(1, int(max_limit))
+            self.min_limit = min(self.min_limit, self.max_limit)
+            self.limit = min(self.limit, self.max_limit)
+            self._cond.notify_all()
+
+    def try_acquire(self):
+        """Takes a slot if one is free right now; returns whether it did."""
+        with self._cond:
+            if self.paused_until > time.monotonic() or self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, latency=None, overloaded=False):
+        """
+        Ends a request. latency: seconds it took, for successful requests;
+        overloaded: the server signalled overload (rate limit, 503, timeout).
+        Requests that failed for other reasons pass neither and leave the limit alone.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if overloaded:
+                self.overloads += 1
+                self._decrease(now, 0.5)
+            elif latency is not None:
+                self._observe(now, latency)
+            self._cond.notify_all()
+
+    def _observe(self, now, latency):
+        self.latency_ema = latency if self.latency_ema is None else 0.8 * self.latency_ema + 0.2 * latency
+        # Best latency seen, drifting up slowly so a one-off fast answer does not stick forever
+        if self.latency_floor is None or self.latency_ema < self.latency_floor:
+            self.latency_floor = self.latency_ema
+        else:
+            self.latency_floor *= 1.001
+        if self.latency_ema > self.latency_floor * self.latency_tolerance:
+            self._decrease(now, 0.9)
+            return
+        self.successes += 1
+        if self.successes >= int(self.limit) and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.successes = 0
+            self.increases += 1
+
+    def _decrease(self, now, factor):
+        # One decrease per latency period (at least a second)
+        if now - self.last_decrease < max(1.0, self.latency_ema or 0.0):
+            return
+        self.last_decrease = now
+        self.successes = 0
+        new_limit = max(self.min_limit, self.limit * factor)
+        if new_limit < self.limit:
+            self.limit = new_limit
+            self.decreases += 1
+
+    def pause(self, seconds):
+        """Holds back new requests for `seconds` (e.g. from a Retry-After header)."""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            return {
+                "limit": int(self.limit),
+                "max_limit": self.max_limit,
+                "in_flight": self.in_flight,
+                "paused_seconds": max(0.0, self.paused_until - time.monotonic()),
+                "latency_ema": self.latency_ema,
+                "overloads": self.overloads,
+                "increases": self.increases,
+                "decreases": self.decreases,
+            }
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    """Full-jitter exponential backoff: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def retry_after_seconds(headers):
+    """Seconds from Retry-After / retry-after-ms response headers, or None."""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,27 +1,61 @@
-import ebooklib
-from ebooklib import epub
-from bs4 import BeautifulSoup
-
-def load_epub(path):
-    """Loads an EPUB file."""
-    return epub.read_epub(path)
-
-def save_epub(book, path):
-    """Saves the EPUB book to the specified path."""
-    epub.write_epub(path, book)
-
-def get_chapter_items(book):
-    """Yields (id, content) for all document items."""
-    # Filter for XHTML/HTML documents
-    return [item for item in book.get_items() if item.get_type() == ebooklib.ITEM_DOCUMENT]
-
-def extract_text_from_html(html_content):
-    """Extracts plain text from HTML content using BeautifulSoup."""
-    soup = BeautifulSoup(html_content, 'html.parser')
-    lines = []
-    # Targeted extraction for common novel tags
-    for tag in soup.find_all(['p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-        text = tag.get_text().strip()
-        if text:
-            lines.append(text)
-    return "\n".join(lines)
+import posixpath
+import zipfile
+from urllib.parse import unquote
+from lxml import etree
+
+DOCUMENT_MEDIA_TYPES = ('application/xhtml+xml',)
+
+class ZipDocument:
+    """
+    A document inside an EPUB zip, read only when get_content() is called.
+    Mirrors the ebooklib item methods the text pipeline uses.
+    """
+    def __init__(self, zip_file, path, name, item_id, media_type):
+        self._zip = zip_file
+        self.path = path              # full path inside the zip, e.g. 'OEBPS/xhtml/p-001.xhtml'
+        self.name = name              # href relative to the OPF, as ebooklib's get_name() returns
+        self.id = item_id
+        self.media_type = media_type
+
+    def get_name(self):
+        return self.name
+
+    def get_id(self):
+        return self.id
+
+    def get_content(self):
+        return self._zip.read(self.path)
+
+def iter_document_items(path):
+    """
+    Yields the EPUB's XHTML documents one at a time without loading the book into memory.
+    Only META-INF/container.xml and the OPF are parsed up front; images, fonts and other
+    items are never read. Documents come in spine order, followed by any documents that
+    are in the manifest but not in the spine. The navigation document is skipped, like
+    ebooklib's ITEM_DOCUMENT filter does.
+    """
+    with zipfile.ZipFile(path, 'r') as zf:
+        container = etree.fromstring(zf.read('META-INF/container.xml'))
+        rootfile = container.find('.//{*}rootfile')
+        opf_path = rootfile.get('full-path')
+        opf_dir = posixpath.dirname(opf_path)
+        opf = etree.fromstring(zf.read(opf_path))
+
+        documents = {}
+        manifest_order = []
+        for item in opf.iterfind('.//{*}manifest/{*}item'):
+            if item.get('media-type') not in DOCUMENT_MEDIA_TYPES:
+                continue
+            if 'nav' in (item.get('properties') or '').split():
+                continue
+            name = unquote(item.get('href'))
+            documents[item.get('id')] = ZipDocument(
+                zf, posixpath.normpath(posixpath.join(opf_dir, name)), name, item.get('id'), item.get('media-type'))
+            manifest_order.append(item.get('id'))
+
+        spine_order = [ref.get('idref') for ref in opf.iterfind('.//{*}spine/{*}itemref')]
+        seen = set()
+        for item_id in spine_order + manifest_order:
+            if item_id in documents and item_id not in seen:
+                seen.add(item_id)
+                yield documents[item_id]
@@ -0,0 +1,100 @@
+import hashlib
+import json
+import os
+from lxml import etree, html as lxml_html
+from src.epub_handler import iter_document_items
+
+# Bump when the extraction rules below change, so cached results are rebuilt.
+EXTRACT_VERSION = 2
+
+# Tags that become review segments (leaf blocks only) and tags that make up plain text lines
+SEGMENT_TAGS = {'p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+BLOCK_TAGS = {'p', 'div', 'blockquote'}
+TEXT_TAGS = {'p', 'div', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+
+
+def _local(tag):
+    # Comments and processing instructions have a function as tag
+    return tag.rsplit('}', 1)[-1] if isinstance(tag, str) else None
+
+
+def _parse(content):
+    """
+    Parses XHTML with lxml in recover mode, the same parser setup BeautifulSoup's 'xml'
+    builder uses, so segment text matches what assemble_epub sees when it re-parses.
+    Falls back to the HTML parser for documents that are not XML at all.
+    """
+    parser = etree.XMLParser(recover=True, huge_tree=True)
+    try:
+        root = etree.fromstring(content, parser)
+    except etree.XMLSyntaxError:
+        root = None
+    if root is None:
+        try:
+            root = lxml_html.fromstring(content)
+        except etree.ParserError:
+            # Empty document
+            root = etree.Element('html')
+    return root
+
+
+def extract_chapter(name, content):
+    """
+    Reads one chapter document in a single parse.
+    Returns {"name", "segments", "text", "line_count"}:
+      segments   - stripped text of leaf <p>/<h1-6> blocks, as used by prepare/export
+      text       - one line per <p>/<div>/<h1-6> block, as used by alignment and term scanning
+      line_count - number of non-empty lines in text
+    """
+    root = _parse(content)
+    segments = []
+    lines = []
+    for el in root.iter():
+        tag = _local(el.tag)
+        if tag not in TEXT_TAGS:
+            continue
+        text = ''.join(el.itertext()).strip()
+        if not text:
+            continue
+        lines.append(text)
+        if tag in SEGMENT_TAGS and not any(_local(d.tag) in BLOCK_TAGS for d in el.iterdescendants()):
+            segments.append(text)
+    text = "\n".join(lines)
+    return {
+        "name": name,
+        "segments": segments,
+        "text": text,
+        "line_count": sum(1 for l in text.split('\n') if l.strip()),
+    }
+
+
+def file_hash(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def extract_book(path, cache_dir=None, use_cache=True):
+    """
+    Returns extract_chapter() results for every document of the EPUB, in spine order.
+    Results are cached on disk under the EPUB's content hash, so align, extract-glossary
+    and prepare parse each book only once.
+    """
+    cache_dir = cache_dir or os.getenv("EXTRACT_CACHE_DIR", ".cache/extract")
+    cache_path = os.path.join(cache_dir, f"{file_hash(path)}-v{EXTRACT_VERSION}.json")
+    if use_cache and os.path.exists(cache_path):
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    # Documents are read from the zip one at a time, in spine order
+    chapters = [extract_chapter(item.get_name(), item.get_content()) for item in iter_document_items(path)]
+
+    if use_cache:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = cache_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(chapters, f, ensure_ascii=False)
+        os.replace(tmp_path, cache_path)
+    return chapters
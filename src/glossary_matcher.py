@@ -0,0 +1,142 @@
+import threading
+from collections import deque
+
+
+class GlossaryMatcher:
+    """
+    Aho-Corasick automaton over the glossary's source terms.
+    Finds every term occurrence in one pass over the text, independent of glossary size.
+    """
+
+    def __init__(self, terms):
+        # Node 0 is the root. goto[n] maps a character to the next node,
+        # term[n] is the term ending at n (or None), out[n] is the nearest
+        # terminal node on n's failure chain (dictionary suffix link).
+        self.goto = [{}]
+        self.fail = [0]
+        self.term = [None]
+        self.out = [0]
+        for t in terms:
+            if t:
+                self._insert(t)
+        self._build()
+
+    def _insert(self, word):
+        node = 0
+        for ch in word:
+            nxt = self.goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self.goto)
+                self.goto[node][ch] = nxt
+                self.goto.append({})
+                self.fail.append(0)
+                self.term.append(None)
+                self.out.append(0)
+            node = nxt
+        self.term[node] = word
+
+    def _build(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                f = self.fail[node]
+                while f and ch not in self.goto[f]:
+                    f = self.fail[f]
+                fc = self.goto[f].get(ch, 0)
+                self.fail[child] = fc if fc != child else 0
+                fail_node = self.fail[child]
+                self.out[child] = fail_node if self.term[fail_node] else self.out[fail_node]
+
+    def find_all(self, text):
+        """Yields (start, end, term) for every occurrence, including overlapping ones."""
+        goto, fail, term, out = self.goto, self.fail, self.term, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            hit = node if term[node] else out[node]
+            while hit:
+                word = term[hit]
+                yield i + 1 - len(word), i + 1, word
+                hit = out[hit]
+
+    def find(self, text):
+        """
+        Returns non-overlapping (start, end, term) matches in text order.
+        Where terms overlap, the leftmost and then the longest one wins,
+        e.g. "アリス・ベル" is reported instead of the "アリス" inside it.
+        """
+        hits = sorted(self.find_all(text), key=lambda h: (h[0], -h[1]))
+        matches = []
+        pos = 0
+        for start, end, word in hits:
+            if start >= pos:
+                matches.append((start, end, word))
+                pos = end
+        return matches
+
+    def relevant(self, texts, glossary):
+        """Returns {term: translation} for the terms found in texts (a str or a list of str)."""
+        if isinstance(texts, str):
+            texts = [texts]
+        found = {}
+        for text in texts:
+            for _, _, word in self.find(text):
+                if word not in found and word in glossary:
+                    found[word] = glossary[word]
+        return found
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+_CACHE_SIZE = 8
+# id(glossary) -> number of in-place changes, see glossary_changed()
+_versions = {}
+
+
+def glossary_changed(glossary):
+    """
+    Marks a glossary dict as changed in place (e.g. new terms added with update()),
+    so matchers and prompt blocks cached for it are rebuilt on next use.
+    Replacing the dict with a new one needs no call.
+    """
+    with _cache_lock:
+        _versions[id(glossary)] = _versions.get(id(glossary), 0) + 1
+
+
+def glossary_version(glossary):
+    """Change counter of a glossary dict, bumped by glossary_changed()."""
+    return _versions.get(id(glossary), 0)
+
+
+def get_matcher(glossary):
+    """
+    Returns the compiled matcher for this glossary dict.
+    Matchers are cached per dict object and its glossary_version(), so a lookup costs
+    the same whatever the glossary size; the matcher is rebuilt only after glossary_changed().
+    """
+    version = glossary_version(glossary)
+    key = id(glossary)
+    entry = _cache.get(key)
+    # Keep a reference to the dict so its id cannot be reused while cached
+    if entry and entry[0] is glossary and entry[1] == version:
+        return entry[2]
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry and entry[0] is glossary and entry[1] == version:
+            return entry[2]
+        matcher = GlossaryMatcher(glossary.keys())
+        if key not in _cache and len(_cache) >= _CACHE_SIZE:
+            _cache.pop(next(iter(_cache)))
+        _cache[key] = (glossary, version, matcher)
+        return matcher
+
+
+def find_relevant_terms(texts, glossary):
+    """Shortcut: {term: translation} for the glossary terms found in texts."""
+    if not glossary:
+        return {}
+    return get_matcher(glossary).relevant(texts, glossary)
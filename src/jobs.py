@@ -0,0 +1,136 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from src.segment_packer import SegmentPacker
+from src.translator import Translator
+
+
+class Job:
+    """A background translation job over a set of segments, with progress counters."""
+
+    def __init__(self, segments, chapter=None, status=None, overwrite=False):
+        self.id = uuid.uuid4().hex[:12]
+        self.chapter = chapter
+        self.status_filter = status
+        self.overwrite = overwrite
+        self.total = len(segments)
+        self.done = 0          # segments processed (translated, failed or skipped)
+        self.translated = 0
+        self.failed = 0
+        self.state = "queued"  # queued -> running -> completed | cancelled
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.pending_batches = 0
+        self.cancel_event = threading.Event()
+        self.lock = threading.Lock()
+
+    def to_dict(self):
+        with self.lock:
+            elapsed = None
+            eta = None
+            if self.started:
+                elapsed = (self.finished or time.time()) - self.started
+                if self.state == "running" and self.done:
+                    eta = elapsed / self.done * (self.total - self.done)
+            return {
+                "id": self.id,
+                "chapter": self.chapter,
+                "status": self.status_filter,
+                "overwrite": self.overwrite,
+                "state": self.state,
+                "total": self.total,
+                "done": self.done,
+                "translated": self.translated,
+                "failed": self.failed,
+                "progress": self.done / self.total if self.total else 1.0,
+                "elapsed_seconds": elapsed,
+                "eta_seconds": eta,
+            }
+
+
+class JobManager:
+    """
+    Runs background translation jobs for the review server.
+    Segments are packed into translate_batch calls (same packer as prepare --auto-translate)
+    and translated with Translator.translate_pack on one worker pool shared by all jobs;
+    every finished batch is written to the session straight away through ReviewManager.
+    Segments approved while a job runs are left alone, even by overwrite jobs.
+    """
+
+    def __init__(self, get_manager, llm, workers=8, packer=None):
+        self.get_manager = get_manager
+        self.llm = llm
+        self.translator = Translator(llm)
+        self.packer = packer or SegmentPacker(max_model_len=llm.max_model_len, count_tokens=llm.tokens.count)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def start(self, chapter=None, status=None, overwrite=False):
+        """Queues a job for a chapter and/or status filter. Returns the Job."""
+        manager = self.get_manager()
+        segments = manager.find_segments(chapter=chapter, status=status, untranslated=not overwrite)
+        # Approved segments are final; never re-translate them
+        segments = [seg for seg in segments if seg["status"] != "approved"]
+        src_lang = manager.get_meta("src_lang", "Japanese")
+        tgt_lang = manager.get_meta("tgt_lang", "Traditional Chinese")
+        glossary = manager.get_glossary()
+
+        job = Job(segments, chapter=chapter, status=status, overwrite=overwrite)
+        with self._lock:
+            self._jobs[job.id] = job
+
+        batches, _ = self.packer.pack(segments)
+        if not batches:
+            job.state = "completed"
+            job.started = job.finished = time.time()
+            return job
+        job.pending_batches = len(batches)
+        for batch in batches:
+            self._executor.submit(self._run_batch, job, batch, glossary, src_lang, tgt_lang)
+        return job
+
+    def _run_batch(self, job, batch, glossary, src_lang, tgt_lang):
+        with job.lock:
+            if job.state == "queued":
+                job.state = "running"
+                job.started = time.time()
+        translated = failed = 0
+        if not job.cancel_event.is_set():
+            try:
+                # Overwrite jobs re-translate, so cached answers (usually the current drafts) are skipped
+                results = self.translator.translate_pack(batch, src_lang, tgt_lang, glossary, use_cache=not job.overwrite)
+            except Exception as e:
+                print(f"Job {job.id}: batch failed: {e}")
+                results = []
+            done = self.translator.apply_translations(batch, results)
+            translated = self.get_manager().fill_segment_translations({seg["id"]: seg["zh"] for seg in done},
+                                                                      replace_unapproved=job.overwrite)
+            failed = len(batch) - len(done)
+
+        with job.lock:
+            job.done += len(batch)
+            job.translated += translated
+            job.failed += failed
+            job.pending_batches -= 1
+            if job.pending_batches == 0:
+                job.state = "cancelled" if job.cancel_event.is_set() else "completed"
+                job.finished = time.time()
+
+    def cancel(self, job_id):
+        """Stops a job: batches already sent to the LLM finish, the rest are skipped."""
+        job = self.get(job_id)
+        if job is None:
+            return None
+        job.cancel_event.set()
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda j: j.created)
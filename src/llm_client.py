@@ -1,46 +1,322 @@
 import os
-from openai import OpenAI
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import openai
 import json
+from src.concurrency import backoff_delay, retry_after_seconds
+from src.glossary_matcher import find_relevant_terms, glossary_version
+from src.llm_cache import LLMCache
+from src.llm_pool import EndpointPool, parse_endpoints
+from src.metrics import LLM_ERRORS, LLM_LATENCY, LLM_TOKENS
+from src.tokens import TokenCounter
+
+# Bump whenever a prompt template below changes, so cached responses are not reused.
+PROMPT_VERSION = 2
+
+# Glossaries up to this size (estimated tokens) are sent whole at the start of every
+# translation prompt, where vLLM's prefix cache makes them nearly free after the first request.
+PREFIX_GLOSSARY_TOKENS = int(os.getenv("LLM_PREFIX_GLOSSARY_TOKENS", "1536"))
+
+# Tokens kept free between prompt + max_tokens and MAX_MODEL_LEN, to absorb counting error
+CONTEXT_MARGIN = 64
+# A request that cannot leave at least this much room for the answer is not sent
+MIN_OUTPUT_TOKENS = 32
+
+# Retries for requests the server rejected as overloaded (429/5xx, timeouts, dropped connections)
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+
+class PromptTooLongError(ValueError):
+    """The prompt does not fit into the model context with room left for an answer."""
+
 
 class LLMClient:
-    def __init__(self, base_url=None, api_key=None, model="Qwen/Qwen2.5-7B-Instruct"):
-        self.client = OpenAI(
-            base_url=base_url or os.getenv("LLM_API_URL", "http://vllm:8000/v1"),
-            api_key=api_key or os.getenv("LLM_API_KEY", "sk-test")
-        )
+    def __init__(self, base_url=None, api_key=None, model="Qwen/Qwen2.5-7B-Instruct", cache=None, prefix_glossary_tokens=None,
+                 max_model_len=None, token_counter=None, max_concurrency=None):
+        """
+        cache: LLMCache instance, None to use the default on-disk cache (see LLMCache.from_env),
+        or False to disable caching.
+        prefix_glossary_tokens: largest glossary (in tokens) sent whole in the shared
+        system prompt; defaults to PREFIX_GLOSSARY_TOKENS.
+        max_model_len: context size that prompts and max_tokens are fitted into (default MAX_MODEL_LEN).
+        token_counter: TokenCounter to use; by default one for this model.
+        max_concurrency: upper bound for the adaptive in-flight limit, per endpoint (default LLM_CONCURRENCY).
+        base_url: one server URL, several separated by commas, or a list (default LLM_API_URL);
+        with more than one, requests go to the least loaded healthy replica (see EndpointPool).
+        """
+        if isinstance(base_url, (list, tuple)):
+            urls = [url.rstrip('/') for url in base_url]
+        else:
+            urls = parse_endpoints(base_url or os.getenv("LLM_API_URL", "http://vllm:8000/v1"))
+        max_concurrency = int(max_concurrency or os.getenv("LLM_CONCURRENCY", "8"))
+        self.pool = EndpointPool(urls, api_key=api_key or os.getenv("LLM_API_KEY", "sk-test"),
+                                 max_concurrency=max_concurrency)
+        # First endpoint's client, for callers that talk to the API directly
+        self.client = self.pool.endpoints[0].client
         self.model = model
+        self.cache = LLMCache.from_env() if cache is None else (cache or None)
+        self.prefix_glossary_tokens = PREFIX_GLOSSARY_TOKENS if prefix_glossary_tokens is None else prefix_glossary_tokens
+        self._prefix_glossary = None
+        self.max_model_len = int(max_model_len or os.getenv("MAX_MODEL_LEN", "8192"))
+        self.tokens = token_counter or TokenCounter(model)
+        self.stats = {
+            "requests": 0,
+            "prompt_tokens": 0,
+            "completion_tokens": 0,
+            "input_truncated": 0,   # texts cut to fit the context
+            "output_clamped": 0,    # max_tokens lowered to fit the context
+            "over_context": 0,      # requests not sent: prompt alone fills the context
+            "finish_length": 0,     # answers cut off at max_tokens
+            "retries": 0,           # requests sent again after an overload response
+            "throttled": 0,         # responses that carried Retry-After
+            # translate_batch paths
+            "batch_whole": 0,       # batches translated by one request
+            "batch_split": 0,       # failed batches split in two
+            "batch_part": 0,        # halves translated by one request after a split
+            "batch_line": 0,        # single lines sent on their own at the bottom of a split
+            "batch_line_failed": 0, # of those, lines left untranslated
+        }
+        self._stats_lock = threading.Lock()
+
+    def set_max_concurrency(self, n):
+        """Raises or lowers the per-endpoint ceiling of the adaptive in-flight limit (e.g. from --concurrency)."""
+        self.pool.set_max(n)
+
+    @property
+    def max_concurrency(self):
+        """Requests that can be in flight at once over all endpoints; size worker pools by this."""
+        return self.pool.max_concurrency
+
+    def _count(self, key, n=1):
+        with self._stats_lock:
+            self.stats[key] += n
+
+    def request_stats(self):
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats["tokenizer"] = "exact" if self.tokens.exact else f"estimate (x{self.tokens.scale:.2f})"
+        endpoints = self.pool.snapshot()
+        # Totals over all endpoints
+        for key, name in (("limit", "concurrency_limit"), ("max_limit", "concurrency_max"),
+                          ("in_flight", "in_flight"), ("queued", "queued"), ("overloads", "overloads")):
+            stats[name] = sum(e[key] for e in endpoints)
+        stats["endpoints_healthy"] = sum(1 for e in endpoints if e["healthy"])
+        stats["endpoints"] = endpoints
+        return stats
+
+    @staticmethod
+    def _overload_info(error):
+        """(is the server overloaded?, Retry-After seconds or None) for an exception from the API."""
+        response = getattr(error, "response", None)
+        retry_after = retry_after_seconds(getattr(response, "headers", None))
+        if isinstance(error, (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)):
+            return True, retry_after
+        if isinstance(error, openai.APIStatusError) and error.status_code in (408, 409, 429, 502, 503, 504):
+            return True, retry_after
+        return False, retry_after
+
+    @staticmethod
+    def _endpoint_failed(error):
+        """Whether an exception means the endpoint itself is unwell (unreachable or 5xx), not just busy."""
+        return isinstance(error, (openai.APIConnectionError, openai.InternalServerError))
+
+    def _send(self, messages, **params):
+        """
+        Sends one request to the least loaded endpoint, through its adaptive concurrency limiter.
+        Overload errors are retried (up to MAX_RETRIES, possibly on another endpoint) after the
+        server's Retry-After, or after a jittered exponential backoff; other errors are raised
+        straight away. Returns (response, start, endpoint); for streams, the endpoint's slot
+        is released by _chat_stream once the stream ends.
+        """
+        stream = params.get("stream", False)
+        for attempt in range(MAX_RETRIES + 1):
+            endpoint = self.pool.acquire()
+            start = time.monotonic()
+            try:
+                response = endpoint.client.chat.completions.create(model=self.model, messages=messages, **params)
+            except Exception as e:
+                overloaded, retry_after = self._overload_info(e)
+                self.pool.release(endpoint, overloaded=overloaded, failed=self._endpoint_failed(e))
+                if retry_after is not None:
+                    self._count("throttled")
+                    endpoint.limiter.pause(retry_after)
+                if not overloaded or attempt == MAX_RETRIES:
+                    raise
+                self._count("retries")
+                # Other endpoints may take the retry sooner; only this one is held back by Retry-After
+                if len(self.pool.endpoints) == 1 or retry_after is None:
+                    time.sleep(retry_after if retry_after is not None else backoff_delay(attempt))
+                continue
+            if not stream:
+                # Seconds per generated token, so long and short answers are comparable
+                usage = getattr(response, "usage", None)
+                completion = (usage.completion_tokens if usage else None) or 1
+                self.pool.release(endpoint, latency=(time.monotonic() - start) / completion)
+            return response, start, endpoint
+
+    def _fit_output(self, messages, params):
+        """
+        Lowers params["max_tokens"] so prompt + answer fit into max_model_len (and sets it
+        when the caller left it open). Raises PromptTooLongError if there is no room left.
+        """
+        available = self.max_model_len - self.tokens.count_messages(messages) - CONTEXT_MARGIN
+        if available < MIN_OUTPUT_TOKENS:
+            self._count("over_context")
+            raise PromptTooLongError(f"Prompt leaves {available} of {self.max_model_len} context tokens for the answer")
+        requested = params.get("max_tokens")
+        if requested is None or requested > available:
+            if requested is not None:
+                self._count("output_clamped")
+            params = dict(params, max_tokens=available)
+        return params
+
+    def _fit_input(self, text, max_tokens):
+        """Cuts text to max_tokens (counted in stats when it had to be cut)."""
+        text, cut = self.tokens.truncate(text, max_tokens)
+        if cut:
+            self._count("input_truncated")
+        return text
+
+    def _input_budget(self, system_msg, output_tokens, parts=1):
+        """Tokens left for each of `parts` user texts next to system_msg and an answer of output_tokens."""
+        overhead = self.tokens.count_messages([{"role": "system", "content": system_msg}, {"role": "user", "content": ""}])
+        # Allow for the labels around the texts in the user message
+        return max(0, (self.max_model_len - overhead - output_tokens - CONTEXT_MARGIN) // parts - 16)
+
+    def _record_usage(self, method, messages, usage):
+        if usage:
+            with self._stats_lock:
+                self.stats["prompt_tokens"] += usage.prompt_tokens or 0
+                self.stats["completion_tokens"] += usage.completion_tokens or 0
+            LLM_TOKENS.inc(usage.prompt_tokens or 0, method=method, kind="prompt")
+            LLM_TOKENS.inc(usage.completion_tokens or 0, method=method, kind="completion")
+            self.tokens.calibrate(messages, usage.prompt_tokens)
+
+    def _chat(self, method, messages, use_cache=True, validate=None, key_messages=None, **params):
+        """
+        Runs one chat completion and returns the message content.
+        Responses are looked up in / stored to the response cache, keyed by the model,
+        prompt template version, calling method, messages (or key_messages, see
+        _key_messages) and sampling params.
+        use_cache=False skips the lookup but still stores the fresh result.
+        validate: optional check of the content; only answers that pass it are stored
+        (or served from the cache), so a malformed answer is asked for again next time.
+        Answers cut off at max_tokens are not stored.
+        """
+        key = None
+        if self.cache:
+            key = LLMCache.make_key(model=self.model, prompt_version=PROMPT_VERSION, method=method,
+                                    messages=key_messages or messages, params=params)
+            if use_cache:
+                cached = self.cache.get(key)
+                if cached is not None and (validate is None or validate(cached)):
+                    return cached
+
+        # Keyed on the requested params above; the fitted max_tokens follows from the messages
+        params = self._fit_output(messages, params)
+        self._count("requests")
+        # Latency as the caller sees it, retries included
+        started = time.monotonic()
+        try:
+            response, _, _ = self._send(messages, **params)
+        except Exception as e:
+            LLM_ERRORS.inc(method=method, error=type(e).__name__)
+            raise
+        LLM_LATENCY.observe(time.monotonic() - started, method=method)
+        self._record_usage(method, messages, getattr(response, "usage", None))
+        choice = response.choices[0]
+        truncated = choice.finish_reason == "length"
+        if truncated:
+            self._count("finish_length")
+            print(f"Warning: {method} answer was cut off at max_tokens={params['max_tokens']}")
+        content = choice.message.content
+        if key and content and not truncated and (validate is None or validate(content)):
+            self.cache.put(key, content)
+        return content
+
+    def _chat_stream(self, method, messages, use_cache=True, key_messages=None, **params):
+        """Streaming variant of _chat: yields content deltas, caches the full text once complete (and not cut off)."""
+        key = None
+        if self.cache:
+            key = LLMCache.make_key(model=self.model, prompt_version=PROMPT_VERSION, method=method,
+                                    messages=key_messages or messages, params=params)
+            if use_cache:
+                cached = self.cache.get(key)
+                if cached is not None:
+                    yield cached
+                    return
+
+        params = self._fit_output(messages, params)
+        self._count("requests")
+        started = time.monotonic()
+        try:
+            # The last chunk carries token usage (with no choices)
+            stream, start, endpoint = self._send(messages, stream=True, stream_options={"include_usage": True}, **params)
+        except Exception as e:
+            LLM_ERRORS.inc(method=method, error=type(e).__name__)
+            raise
+        parts = []
+        finished = False
+        truncated = False
+        try:
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    self._record_usage(method, messages, chunk.usage)
+                if not chunk.choices:
+                    continue
+                if chunk.choices[0].finish_reason == "length":
+                    self._count("finish_length")
+                    truncated = True
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    yield delta
+            finished = True
+        finally:
+            # Holds its endpoint slot until the stream is done (or abandoned by the caller)
+            content = "".join(parts)
+            if finished:
+                LLM_LATENCY.observe(time.monotonic() - started, method=method)
+                self.pool.release(endpoint, latency=(time.monotonic() - start) / max(1, self.tokens.count(content)))
+            else:
+                self.pool.release(endpoint)
+        if key and content and not truncated:
+            self.cache.put(key, content)
+
+    def cache_stats(self):
+        return self.cache.stats() if self.cache else None
 
     def extract_glossary(self, text, ref_text, src_lang="Japanese", tgt_lang="Traditional Chinese"):
         """
         Extracts names and terms from aligned text.
         """
-        prompt = f"""
-        You are a helpful assistant. 
-        Compare the following {src_lang} text and its {tgt_lang} translation.
-        Identify Proper Nouns (Character Names, Place Names, Weapon Names, Terminology) that are key matching terms.
-        
-        Rules:
-        1. Output a JSON object with a "terms" key.
-        2. "terms" must be a list of objects: {{"source": "...", "target": "..."}}
-        3. Exclude common words.
-        
-        Source ({src_lang}):
-        {text[:1500]}...
-        
-        Reference ({tgt_lang}):
-        {ref_text[:1500]}...
-        
-        Return JSON only.
-        """
+        # Fixed instructions first so requests share a cacheable prefix; the texts come last
+        system_msg = f"""You are a helpful assistant.
+Compare the {src_lang} text and its {tgt_lang} translation given by the user.
+Identify Proper Nouns (Character Names, Place Names, Weapon Names, Terminology) that are key matching terms.
+
+Rules:
+1. Output a JSON object with a "terms" key.
+2. "terms" must be a list of objects: {{"source": "...", "target": "..."}}
+3. Exclude common words.
+
+Return JSON only."""
+        # Source and reference share what the context leaves after the answer
+        budget = self._input_budget(system_msg, 2048, parts=2)
+        user_content = f"""Source ({src_lang}):
+{self._fit_input(text, budget)}
+
+Reference ({tgt_lang}):
+{self._fit_input(ref_text, budget)}"""
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+            return self._chat(
+                "extract_glossary",
+                [{"role": "system", "content": system_msg}, {"role": "user", "content": user_content}],
                 temperature=0.1,
                 max_tokens=2048,
                 response_format={"type": "json_object"}
             )
-            return response.choices[0].message.content
         except Exception as e:
             print(f"Extraction Error: {e}")
             return "{}"
@@ -49,177 +325,246 @@ class LLMClient:
         """
         Analyzes text to find new proper nouns.
         """
-        prompt = f"""
-        You are a translation assistant.
-        Analyze the {src_lang} text below. Identify proper nouns (Characters, Places, Unique Items, Spells) that are likely specific to this story.
-        
-        Rules:
-        1. Identify proper nouns.
-        2. STRICTLY EXCLUDE common nouns (e.g. "Village", "Road", "School", "Time") unless part of a proper name.
-        3. Output a JSON object with a "terms" key.
-        4. Format: {{"source": "Original Term ({src_lang})", "target": "Translated Term ({tgt_lang})"}}
-        
-        Example Output:
-        {{
-            "terms": [
-                {{"source": "Original Name", "target": "Translated Name"}}
-            ]
-        }}
-        
-        Text:
-        {text[:2500]}
-        
-        Return JSON only.
-        """
-        
+        # Fixed instructions first so requests share a cacheable prefix; the text comes last
+        system_msg = f"""You are a translation assistant.
+Analyze the {src_lang} text given by the user. Identify proper nouns (Characters, Places, Unique Items, Spells) that are likely specific to this story.
+
+Rules:
+1. Identify proper nouns.
+2. STRICTLY EXCLUDE common nouns (e.g. "Village", "Road", "School", "Time") unless part of a proper name.
+3. Output a JSON object with a "terms" key.
+4. Format: {{"source": "Original Term ({src_lang})", "target": "Translated Term ({tgt_lang})"}}
+
+Example Output:
+{{
+    "terms": [
+        {{"source": "Original Name", "target": "Translated Name"}}
+    ]
+}}
+
+Return JSON only."""
+
         try:
-             response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
+             return self._chat(
+                "extract_new_terms",
+                [{"role": "system", "content": system_msg},
+                 {"role": "user", "content": f"Text:\n{self._fit_input(text, self._input_budget(system_msg, 2048))}"}],
                 temperature=0.3,
                 max_tokens=2048,
             )
-             return response.choices[0].message.content
-        except Exception as e:
-            print(f"Term Extraction Error: {e}")
-            return "{}"
-        try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[{"role": "user", "content": prompt}],
-                temperature=0.3,
-                max_tokens=1024,
-                response_format={"type": "json_object"}
-            )
-            return response.choices[0].message.content
         except Exception as e:
             print(f"Term Extraction Error: {e}")
             return "{}"
 
-    def translate_batch(self, texts, glossary=None, src_lang="Japanese", tgt_lang="Traditional Chinese"):
+    def _prefix_block(self, glossary):
+        """The whole glossary as a system prompt block, or None if it does not fit in prefix_glossary_tokens."""
+        if not glossary:
+            return None
+        # Rebuilt when the dict is replaced or marked changed, without hashing it on every call
+        version = (glossary_version(glossary), self.prefix_glossary_tokens)
+        cached = self._prefix_glossary
+        if not (cached and cached[0] is glossary and cached[1] == version):
+            block = f"Glossary:\n{json.dumps(dict(sorted(glossary.items())), ensure_ascii=False)}\n"
+            fits = self.tokens.count(block) <= self.prefix_glossary_tokens
+            cached = self._prefix_glossary = (glossary, version, block if fits else None)
+        return cached[2]
+
+    def _glossary_blocks(self, texts, glossary, prefix=True):
         """
-        Translates a batch of texts using strict JSON List output.
-        Retries with simplified prompt on failure.
+        Returns (prefix_block, user_block) for the glossary.
+        The whole book glossary, in sorted order, goes into the system prompt when it fits in
+        prefix_glossary_tokens: every request of the book then starts with the same text and
+        vLLM's prefix cache skips recomputing it. A larger glossary (or prefix=False) falls back
+        to the subset of terms found in texts, placed at the start of the user message.
         """
-        if not texts:
-            return []
+        if not glossary:
+            return "", ""
+        block = self._prefix_block(glossary) if prefix else None
+        if block is not None:
+            return block, ""
+        relevant = find_relevant_terms(texts, glossary)
+        if not relevant:
+            return "", ""
+        return "", f"Glossary:\n{json.dumps(dict(sorted(relevant.items())), ensure_ascii=False)}\n\n"
 
-        # Prepare glossary string
-        glossary_str = ""
-        if glossary:
-            relevant_glossary = {k: v for k, v in glossary.items() if k in "".join(texts)}
-            if relevant_glossary:
-                glossary_str = f"Glossary:\n{json.dumps(relevant_glossary, ensure_ascii=False)}\n"
+    def _key_messages(self, build, texts, glossary, src_lang, tgt_lang):
+        """
+        What the response cache is keyed on instead of the messages sent, or None to key on
+        those. With the whole glossary in the system prompt, the key is built from the layout
+        with only the terms found in texts, so adding a term (every volume of a series does)
+        keeps the cached translations of all the segments it does not appear in.
+        """
+        if self._prefix_block(glossary) is None:
+            return None
+        return build(texts, glossary, src_lang, tgt_lang, prefix=False)
 
-        # Strategy 1: JSON List Format (Simpler than Object)
+    def _batch_messages(self, texts, glossary, src_lang, tgt_lang, prefix=True):
+        # Stable part first (rules, then glossary), the lines to translate last
+        prefix_glossary, user_glossary = self._glossary_blocks(texts, glossary, prefix)
         system_msg = f"""You are a professional translator of {src_lang} into {tgt_lang}.
 Rules:
 1. Translate each line maintaining context and flow.
 2. Output a JSON LIST of strings: ["translation1", "translation2"].
 3. Preserve the exact number of lines (N inputs -> N outputs).
 4. Use the glossary if provided.
-"""
-
-        user_content = f"{glossary_str}\nTranslate these {len(texts)} lines:\n"
-        for i, text in enumerate(texts):
-            user_content += f"{text}\n" # Just list them, index is implied by order
-
-        def attempt_translation(retries=1):
-            for attempt in range(retries + 1):
-                try:
-                    response = self.client.chat.completions.create(
-                        model=self.model,
-                        messages=[
-                            {"role": "system", "content": system_msg},
-                            {"role": "user", "content": user_content}
-                        ],
-                        temperature=0.3,
-                        max_tokens=4096,
-                        response_format={"type": "json_object"} 
-                        # Note: 'json_object' usually requires 'JSON' in prompt, which we have.
-                        # Some models prefer 'json_schema' but strict json_object is good for now.
-                        # Actually, for list, we should wrap it: { "data": [...] } to satisfy 'json_object' requirement validation
-                    )
-                    content = response.choices[0].message.content
-                    
-                    # Try to parse
-                    try:
-                        data = json.loads(content)
-                        # Handle { "translations": [...] } or { "data": [...] } or just [...] if model ignored constraint
-                        if isinstance(data, list):
-                            return data
-                        for key in ['translations', 'data', 'list']:
-                            if key in data and isinstance(data[key], list):
-                                return data[key]
-                        # If dict but no known key, maybe it used indices?
-                        # Fallback
-                    except json.JSONDecodeError:
-                        pass
-                        
-                except Exception as e:
-                    print(f"Batch Attempt {attempt+1} Error: {e}")
-            return None
+Output format: {{ "translations": [ "str1", "str2" ] }}
+{prefix_glossary}"""
+        # Just list them, index is implied by order
+        user_content = f"{user_glossary}Translate these {len(texts)} lines:\n" + "".join(f"{text}\n" for text in texts)
+        return [
+            {"role": "system", "content": system_msg},
+            {"role": "user", "content": user_content}
+        ]
 
-        # Updates to System Msg for the wrapper requirement
-        system_msg += "Output format: { \"translations\": [ \"str1\", \"str2\" ] }"
+    def translate_batch(self, texts, glossary=None, src_lang="Japanese", tgt_lang="Traditional Chinese", use_cache=True):
+        """
+        Translates a batch of texts using strict JSON List output.
+        If the answer cannot be used (bad JSON, wrong number of lines) even after a retry,
+        the batch is split in half and both halves are retried concurrently, recursing only
+        into halves that fail again; single lines go through the translate_single prompt.
+        A line that cannot be translated even on its own comes back as None, so the caller
+        leaves it empty and a later run retries it.
+        use_cache=False asks the model again instead of reusing cached answers (re-translation).
+        """
+        if not texts:
+            return []
 
-        translations = attempt_translation(retries=1)
-        
-        if translations and len(translations) == len(texts):
+        translations = self._batch_attempt(texts, glossary, src_lang, tgt_lang, retries=1, use_cache=use_cache)
+        if translations is not None:
+            self._count("batch_whole")
             return translations
-        
-        # Fallback: Line-by-line (Slow but safe) if batch fails
-        print("Batch translation failed or mismatched. Falling back to line-by-line...")
-        fallback_results = []
-        for text in texts:
+
+        print(f"Batch translation of {len(texts)} lines failed or mismatched. Retrying in halves...")
+        return self._translate_halves(texts, glossary, src_lang, tgt_lang, use_cache)
+
+    def _batch_attempt(self, texts, glossary, src_lang, tgt_lang, retries=0, use_cache=True):
+        """One translate_batch request (plus retries); returns the translations, or None if unusable."""
+        # Strategy 1: JSON List Format (Simpler than Object)
+        messages = self._batch_messages(texts, glossary, src_lang, tgt_lang)
+        key_messages = self._key_messages(self._batch_messages, texts, glossary, src_lang, tgt_lang)
+        for attempt in range(retries + 1):
             try:
-                # specific individual prompt
-                res = self.client.chat.completions.create(
-                     model=self.model,
-                     messages=[
-                         {"role": "system", "content": f"Translate to {tgt_lang}. Output ONLY the translation."},
-                         {"role": "user", "content": text}
-                     ],
-                     temperature=0.3
+                content = self._chat(
+                    "translate_batch",
+                    messages,
+                    use_cache=use_cache,
+                    key_messages=key_messages,
+                    # Only answers with one string per line are cached, so halves of a split
+                    # that failed before are asked again instead of failing from the cache
+                    validate=lambda c: self._parse_batch(c, len(texts)) is not None,
+                    temperature=0.3,
+                    max_tokens=4096,
+                    response_format={"type": "json_object"} 
+                    # Note: 'json_object' usually requires 'JSON' in prompt, which we have.
+                    # Some models prefer 'json_schema' but strict json_object is good for now.
+                    # Actually, for list, we should wrap it: { "data": [...] } to satisfy 'json_object' requirement validation
                 )
-                fallback_results.append(res.choices[0].message.content.strip())
-            except:
-                fallback_results.append(text) # worst case
-        
-        return fallback_results
+                translations = self._parse_batch(content, len(texts))
+                if translations is not None:
+                    return translations
+            except Exception as e:
+                print(f"Batch Attempt {attempt+1} Error: {e}")
+        return None
+
+    @staticmethod
+    def _parse_batch(content, n):
+        """The list of n translation strings in a translate_batch answer, or None if it has no such list."""
+        try:
+            data = json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            return None
+        translations = None
+        # Handle { "translations": [...] } or { "data": [...] } or just [...] if model ignored constraint
+        if isinstance(data, list):
+            translations = data
+        elif isinstance(data, dict):
+            for key in ['translations', 'data', 'list']:
+                if key in data and isinstance(data[key], list):
+                    translations = data[key]
+                    break
+        if translations is not None and len(translations) == n and all(isinstance(t, str) for t in translations):
+            return translations
+        return None
+
+    def _translate_halves(self, texts, glossary, src_lang, tgt_lang, use_cache=True):
+        # The second half runs on its own thread while this one handles the first
+        self._count("batch_split")
+        mid = len(texts) // 2
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            second = pool.submit(self._translate_part, texts[mid:], glossary, src_lang, tgt_lang, use_cache)
+            first = self._translate_part(texts[:mid], glossary, src_lang, tgt_lang, use_cache)
+            return first + second.result()
+
+    def _translate_part(self, texts, glossary, src_lang, tgt_lang, use_cache=True):
+        if len(texts) == 1:
+            return [self._translate_line(texts[0], glossary, src_lang, tgt_lang, use_cache)]
+        translations = self._batch_attempt(texts, glossary, src_lang, tgt_lang, use_cache=use_cache)
+        if translations is not None:
+            self._count("batch_part")
+            return translations
+        return self._translate_halves(texts, glossary, src_lang, tgt_lang, use_cache)
 
-    def translate_single(self, text, glossary=None, src_lang="Japanese", tgt_lang="Traditional Chinese"):
+    def _translate_line(self, text, glossary, src_lang, tgt_lang, use_cache=True):
+        # Leaf of the split: same prompt (and cache entries) as translate_single
+        self._count("batch_line")
+        try:
+            content = self._chat(
+                "translate_single",
+                self._single_messages(text, glossary, src_lang, tgt_lang),
+                use_cache=use_cache,
+                key_messages=self._key_messages(self._single_messages, text, glossary, src_lang, tgt_lang),
+                temperature=0.3,
+                max_tokens=2048
+            )
+            if content and content.strip():
+                return content.strip()
+        except Exception as e:
+            print(f"Line Translation Error: {e}")
+        self._count("batch_line_failed")
+        return None
+
+    def _single_messages(self, text, glossary, src_lang, tgt_lang, prefix=True):
+        # Stable part first (rules, then glossary), the text to translate last
+        prefix_glossary, user_glossary = self._glossary_blocks(text, glossary, prefix)
+        system_msg = f"""You are a professional translator. Translate the following {src_lang} text to {tgt_lang}.
+Output ONLY the translation. Do not include notes or explanations.
+{prefix_glossary}"""
+        return [
+            {"role": "system", "content": system_msg},
+            {"role": "user", "content": f"{user_glossary}Text:\n{text}"}
+        ]
+
+    def translate_single(self, text, glossary=None, src_lang="Japanese", tgt_lang="Traditional Chinese", use_cache=True):
         """
         Translates a single segment efficiently for the Web UI.
         No JSON overhead, just direct text-to-text.
+        use_cache=False always asks the model (the reviewer's "regenerate"); the answer is still cached.
         """
-        glossary_str = ""
-        if glossary:
-            # Simple keyword matching
-            relevant = {k: v for k, v in glossary.items() if k in text}
-            if relevant:
-                glossary_str = f"Glossary:\n{json.dumps(relevant, ensure_ascii=False)}\n"
-        
-        prompt = f"""
-        You are a professional translator. Translate the following {src_lang} text to {tgt_lang}.
-        Output ONLY the translation. Do not include notes or explanations.
-        
-        {glossary_str}
-        
-        Text:
-        {text}
-        """
-        
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+            content = self._chat(
+                "translate_single",
+                self._single_messages(text, glossary, src_lang, tgt_lang),
+                use_cache=use_cache,
+                key_messages=self._key_messages(self._single_messages, text, glossary, src_lang, tgt_lang),
                 temperature=0.3,
                 max_tokens=2048
             )
-            return response.choices[0].message.content.strip()
+            return content.strip() if content else None
         except Exception as e:
             print(f"Single Translation Error: {e}")
             return None
+
+    def translate_single_stream(self, text, glossary=None, src_lang="Japanese", tgt_lang="Traditional Chinese", use_cache=True):
+        """
+        Same prompt as translate_single, but yields the translation piece by piece as tokens arrive.
+        Shares translate_single's cache entries; a cached translation is yielded in one piece.
+        Errors are raised to the caller.
+        """
+        return self._chat_stream(
+            "translate_single",
+            self._single_messages(text, glossary, src_lang, tgt_lang),
+            use_cache=use_cache,
+            key_messages=self._key_messages(self._single_messages, text, glossary, src_lang, tgt_lang),
+            temperature=0.3,
+            max_tokens=2048
+        )
@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from openai import OpenAI
+from src.concurrency import AdaptiveLimiter
+
+
+def parse_endpoints(value):
+    """Comma-separated LLM_API_URL value -> list of base URLs (whitespace and trailing '/' removed)."""
+    return [url.strip().rstrip('/') for url in (value or "").split(',') if url.strip()]
+
+
+def check_endpoint(base_url, api_key=None, timeout=5):
+    """
+    Health check: GET {base_url}/models. Returns None when healthy,
+    otherwise a short description of what went wrong.
+    """
+    req = urllib.request.Request(f"{base_url}/models")
+    if api_key:
+        req.add_header("Authorization", f"Bearer {api_key}")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as response:
+            if response.status == 200:
+                return None
+            return f"HTTP {response.status}"
+    except urllib.error.HTTPError as e:
+        return f"HTTP {e.code}"
+    except urllib.error.URLError as e:
+        return f"Connection Error: {e.reason}"
+    except Exception as e:
+        return f"Unexpected Error: {e}"
+
+
+class Endpoint:
+    """One OpenAI-compatible server: its client, its own adaptive limit and health state."""
+
+    def __init__(self, url, api_key, max_concurrency):
+        self.url = url
+        self.client = OpenAI(
+            base_url=url,
+            api_key=api_key,
+            # Retries are LLMClient's, so overload responses reach the limiter
+            max_retries=0
+        )
+        self.limiter = AdaptiveLimiter(max_limit=max_concurrency, initial=min(max_concurrency, 8))
+        self.healthy = True
+        self.failures = 0       # consecutive failed requests
+        self.last_error = None
+        self.requests = 0
+        self.ejections = 0
+        self.queued = 0         # requests in EndpointPool.acquire() that would go here next
+
+
+class EndpointPool:
+    """
+    Routes requests over one or more LLM servers (vLLM replicas).
+
+    acquire() picks the healthy endpoint with the lowest load (in-flight requests relative
+    to its adaptive limit) that has a free slot, and waits when all are busy; a waiting
+    request is counted as queued on the least loaded endpoint. An endpoint
+    is ejected after `max_failures` consecutive failed requests or a failed health check,
+    and a background thread (started when there is more than one endpoint) checks every
+    `health_interval` seconds and brings it back once /models answers again.
+    If every endpoint is ejected, requests still go to all of them rather than nowhere.
+    """
+
+    def __init__(self, urls, api_key=None, max_concurrency=8, health_interval=None, max_failures=3):
+        if not urls:
+            raise ValueError("No LLM endpoints configured")
+        self.api_key = api_key
+        self.endpoints = [Endpoint(url, api_key, max_concurrency) for url in urls]
+        self.health_interval = float(health_interval if health_interval is not None else os.getenv("LLM_HEALTH_INTERVAL", "10"))
+        self.max_failures = max_failures
+        self._cond = threading.Condition()
+        self._health_thread = None
+        if len(self.endpoints) > 1 and self.health_interval > 0:
+            self._health_thread = threading.Thread(target=self._health_loop, name="llm-health", daemon=True)
+            self._health_thread.start()
+
+    def set_max(self, max_concurrency):
+        """Per-endpoint ceiling of the adaptive limit."""
+        for endpoint in self.endpoints:
+            endpoint.limiter.set_max(max_concurrency)
+        with self._cond:
+            self._cond.notify_all()
+
+    @property
+    def max_concurrency(self):
+        """Total ceiling over all endpoints, i.e. how many workers can usefully wait on the pool."""
+        return sum(endpoint.limiter.max_limit for endpoint in self.endpoints)
+
+    def _candidates(self):
+        healthy = [e for e in self.endpoints if e.healthy]
+        return healthy or self.endpoints
+
+    def acquire(self):
+        """Returns the endpoint to send the next request to; its limiter slot is taken."""
+        waiting_on = None
+        with self._cond:
+            try:
+                while True:
+                    candidates = sorted(self._candidates(),
+                                        key=lambda e: e.limiter.in_flight / max(1, int(e.limiter.limit)))
+                    for endpoint in candidates:
+                        if endpoint.limiter.try_acquire():
+                            endpoint.requests += 1
+                            return endpoint
+                    # Spread waiters over the endpoints by the load they would find there
+                    target = min(candidates, key=lambda e: (e.limiter.in_flight + e.queued - (e is waiting_on))
+                                 / max(1, int(e.limiter.limit)))
+                    if target is not waiting_on:
+                        if waiting_on is not None:
+                            waiting_on.queued -= 1
+                        waiting_on = target
+                        waiting_on.queued += 1
+                    # Woken by release(); the timeout covers Retry-After pauses running out
+                    self._cond.wait(timeout=0.1)
+            finally:
+                if waiting_on is not None:
+                    waiting_on.queued -= 1
+
+    def release(self, endpoint, latency=None, overloaded=False, failed=False):
+        """
+        Ends a request on endpoint. failed: the endpoint itself misbehaved
+        (connection error, 5xx), which counts towards ejection.
+        """
+        endpoint.limiter.release(latency=latency, overloaded=overloaded)
+        with self._cond:
+            if failed:
+                endpoint.failures += 1
+                if endpoint.healthy and endpoint.failures >= self.max_failures and len(self.endpoints) > 1:
+                    self._eject(endpoint, f"{endpoint.failures} consecutive failures")
+            elif latency is not None:
+                endpoint.failures = 0
+            self._cond.notify_all()
+
+    def _eject(self, endpoint, reason):
+        endpoint.healthy = False
+        endpoint.last_error = reason
+        endpoint.ejections += 1
+        print(f"LLM endpoint {endpoint.url} ejected: {reason}")
+
+    def check_health(self):
+        """Runs one health check round over all endpoints; returns the number of healthy ones."""
+        for endpoint in self.endpoints:
+            error = check_endpoint(endpoint.url, self.api_key)
+            with self._cond:
+                if error is None:
+                    if not endpoint.healthy:
+                        print(f"LLM endpoint {endpoint.url} is back")
+                    endpoint.healthy = True
+                    endpoint.failures = 0
+                elif endpoint.healthy and len(self.endpoints) > 1:
+                    self._eject(endpoint, error)
+                else:
+                    endpoint.last_error = error
+                self._cond.notify_all()
+        return sum(1 for e in self.endpoints if e.healthy)
+
+    def _health_loop(self):
+        while True:
+            time.sleep(self.health_interval)
+            try:
+                self.check_health()
+            except Exception as e:
+                print(f"LLM health check error: {e}")
+
+    def snapshot(self):
+        """Per-endpoint state for stats: url, healthy, limit, in_flight, queued, requests, ejections."""
+        result = []
+        for endpoint in self.endpoints:
+            limiter = endpoint.limiter.snapshot()
+            result.append({
+                "url": endpoint.url,
+                "healthy": endpoint.healthy,
+                "requests": endpoint.requests,
+                "ejections": endpoint.ejections,
+                "last_error": endpoint.last_error,
+                "queued": endpoint.queued,
+                **limiter,
+            })
+        return result
@@ -24,6 +24,7 @@ def main():
     align_parser.add_argument('--model', default=default_model, help='LLM Model Name')
     align_parser.add_argument('--src-lang', default='Japanese', help='Source Language')
     align_parser.add_argument('--tgt-lang', default='Traditional Chinese', help='Target Language')
+    align_parser.add_argument('--concurrency', type=int, default=int(os.getenv('LLM_CONCURRENCY', '8')), help='Max LLM requests in flight per endpoint')
 
     # Translate command
     trans_parser = subparsers.add_parser('translate')
@@ -37,6 +38,9 @@ def main():
     extract_parser.add_argument('--model', default=default_model, help='LLM Model Name')
     extract_parser.add_argument('--src-lang', default='Japanese', help='Source Language')
     extract_parser.add_argument('--tgt-lang', default='Traditional Chinese', help='Target Language')
+    extract_parser.add_argument('--concurrency', type=int, default=int(os.getenv('LLM_CONCURRENCY', '8')), help='Max LLM requests in flight per endpoint')
+    extract_parser.add_argument('--window-chars', type=int, default=2500, help='Characters of text per term extraction request')
+    extract_parser.add_argument('--min-votes', type=int, default=1, help='Keep only terms proposed by at least this many windows')
 
     # --- Prepare Session Command ---
     prepare_parser = subparsers.add_parser('prepare', help='Prepare a review session from an EPUB')
@@ -47,6 +51,23 @@ def main():
     prepare_parser.add_argument('--src-lang', default='Japanese', help='Source Language (e.g. Japanese, English)')
     prepare_parser.add_argument('--tgt-lang', default='Traditional Chinese', help='Target Language (e.g. Traditional Chinese, Spanish)')
     prepare_parser.add_argument('--auto-translate', action='store_true', help='Automatically translate all segments with LLM')
+    prepare_parser.add_argument('--concurrency', type=int, default=int(os.getenv('LLM_CONCURRENCY', '8')), help='Max LLM requests in flight per endpoint during auto-translate')
+    prepare_parser.add_argument('--resume', action='store_true', help='Continue an interrupted run: keep the existing session and translate only untranslated segments')
+    prepare_parser.add_argument('--no-batch', action='store_true', help='Translate one segment per request instead of packing token-budgeted batches')
+
+    # --- Series Batch Command ---
+    batch_parser = subparsers.add_parser('batch', help='Extract terms, prepare and auto-translate every EPUB in a directory')
+    batch_parser.add_argument('--input-dir', required=True, help='Directory of volume EPUBs (processed in natural name order)')
+    batch_parser.add_argument('--work-root', default='/app/work_series', help='One session directory per volume is created here')
+    batch_parser.add_argument('--glossary', default='glossary.json', help='Series glossary JSON; new terms from every volume are added to it')
+    batch_parser.add_argument('--model', default=default_model, help='Model name')
+    batch_parser.add_argument('--src-lang', default='Japanese', help='Source Language')
+    batch_parser.add_argument('--tgt-lang', default='Traditional Chinese', help='Target Language')
+    batch_parser.add_argument('--concurrency', type=int, default=int(os.getenv('LLM_CONCURRENCY', '8')), help='Max LLM requests in flight per endpoint')
+    batch_parser.add_argument('--no-extract', action='store_true', help='Use the glossary as is, without extracting new terms')
+    batch_parser.add_argument('--no-batch', action='store_true', help='Translate one segment per request instead of packing token-budgeted batches')
+    batch_parser.add_argument('--window-chars', type=int, default=2500, help='Characters of text per term extraction request')
+    batch_parser.add_argument('--min-votes', type=int, default=1, help='Keep only terms proposed by at least this many windows')
 
     review_parser = subparsers.add_parser('review', help='Start the Web Review Server')
     review_parser.add_argument('--port', type=int, default=5000, help='Port to run server on')
@@ -57,6 +78,14 @@ def main():
     export_parser.add_argument('--input', required=True, help='Original JP EPUB (template)')
     export_parser.add_argument('--output', required=True, help='Output ZH EPUB')
     export_parser.add_argument('--work-dir', default='/app/work_session', help='Session directory')
+    export_parser.add_argument('--workers', type=int, default=None, help='Processes used to rewrite chapters (default: CPU count)')
+    export_parser.add_argument('--full-rebuild', action='store_true', help='Re-render every chapter instead of reusing the build cache')
+
+    # --- Session JSON import/export ---
+    session_parser = subparsers.add_parser('session', help='Import/export a review session as session.json')
+    session_parser.add_argument('--work-dir', default='/app/work_session', help='Session directory')
+    session_parser.add_argument('--export-json', nargs='?', const='', default=None, help='Write the session to a JSON file (default: <work-dir>/session.json)')
+    session_parser.add_argument('--import-json', help='Replace the session with the contents of a session.json file')
 
     args = parser.parse_args()
 
@@ -66,6 +95,11 @@ def main():
     # Only if args.model doesn't exist (e.g. some new command without it), fallback to default_model
     model_name = args.model if hasattr(args, 'model') else default_model
     client = LLMClient(model=model_name)
+    if getattr(args, 'concurrency', None):
+        # --concurrency is the ceiling of the adaptive in-flight limit per endpoint;
+        # worker threads cover all endpoints
+        client.set_max_concurrency(args.concurrency)
+        args.concurrency = client.max_concurrency
 
     if args.command == 'align':
         print(f"Running alignment ({args.src_lang} -> {args.tgt_lang}) and glossary extraction...")
@@ -74,15 +108,32 @@ def main():
         pairs = aligner.align_chapters()
         
         # Pass language args for prompt accuracy
-        glossary = aligner.extract_glossary_from_pairs(pairs, src_lang=args.src_lang, tgt_lang=args.tgt_lang)
+        glossary = aligner.extract_glossary_from_pairs(pairs, src_lang=args.src_lang, tgt_lang=args.tgt_lang, concurrency=args.concurrency)
         aligner.save_glossary(glossary, args.out)
         print(f"Glossary saved to {args.out}")
 
     elif args.command == 'prepare':
-        llm = LLMClient(model=args.model) # Need LLM just initialized, though prepare only needs text processing
         # Use Translator class to leverage existing epub loading logic
-        translator = Translator(llm, args.glossary)
-        translator.prepare_review_session(args.input, args.work_dir, args.src_lang, args.tgt_lang, args.auto_translate)
+        translator = Translator(client, args.glossary)
+        try:
+            translator.prepare_review_session(args.input, args.work_dir, args.src_lang, args.tgt_lang, args.auto_translate,
+                                              concurrency=args.concurrency, batch=not args.no_batch, resume=args.resume)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+
+    elif args.command == 'batch':
+        from src.batch import SeriesBatch, find_volumes
+        volumes = find_volumes(args.input_dir)
+        if not volumes:
+            print(f"Error: no .epub files in {args.input_dir}")
+            sys.exit(1)
+        series = SeriesBatch(client, args.glossary, args.work_root, args.src_lang, args.tgt_lang,
+                             extract=not args.no_extract, batch=not args.no_batch,
+                             window_chars=args.window_chars, min_votes=args.min_votes, workers=args.concurrency)
+        results = series.run(volumes)
+        if any(v.error for v in results):
+            sys.exit(1)
 
     elif args.command == 'review':
         print(f"Starting Review Server on port {args.port} with model {args.model}...")
@@ -97,19 +148,53 @@ def main():
 
     elif args.command == 'export':
         # Need Translator for Epub logic
-        llm = LLMClient() 
-        translator = Translator(llm)
-        translator.assemble_epub(args.input, args.work_dir, args.output)
+        translator = Translator(client)
+        translator.assemble_epub(args.input, args.work_dir, args.output, workers=args.workers, incremental=not args.full_rebuild)
+
+    elif args.command == 'session':
+        from src.review_manager import ReviewManager
+        mgr = ReviewManager(args.work_dir)
+        if args.import_json:
+            mgr.import_json(args.import_json)
+            print(f"Imported {args.import_json} into {mgr.db_file}")
+        if args.export_json is not None:
+            path = mgr.export_json(args.export_json or None)
+            print(f"Exported session to {path}")
 
     elif args.command == 'extract-glossary':
         print(f"Extracting new terms from {args.input}...")
         # Initialize translator just for glossary access
         translator = Translator(client, args.base_glossary)
-        translator.extract_terms_from_epub(args.input, args.src_lang, args.tgt_lang, update_existing=True)
+        translator.extract_terms_from_epub(args.input, args.src_lang, args.tgt_lang, update_existing=True,
+                                           concurrency=args.concurrency, window_chars=args.window_chars, min_votes=args.min_votes)
 
 
     else:
         parser.print_help()
+        return
+
+    # Report response cache effectiveness for commands that talked to the LLM
+    stats = client.cache_stats()
+    if stats and (stats['hits'] or stats['misses']):
+        print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses ({stats['hit_rate']:.0%} hit rate), {stats['entries']} entries")
+    requests = client.request_stats()
+    if requests['requests']:
+        print(f"LLM tokens: {requests['prompt_tokens']} prompt, {requests['completion_tokens']} completion in {requests['requests']} requests "
+              f"(counts: {requests['tokenizer']}); {requests['input_truncated']} inputs truncated, "
+              f"{requests['output_clamped']} max_tokens clamped, {requests['over_context']} prompts too long, "
+              f"{requests['finish_length']} answers cut off")
+    if requests['batch_split']:
+        print(f"Batches: {requests['batch_whole']} translated whole, {requests['batch_split']} splits, "
+              f"{requests['batch_part']} halves translated, {requests['batch_line']} single lines "
+              f"({requests['batch_line_failed']} failed)")
+    if requests['overloads'] or requests['retries']:
+        print(f"LLM concurrency: limit {requests['concurrency_limit']} of {requests['concurrency_max']} at the end, "
+              f"{requests['overloads']} overload responses, {requests['retries']} retries, {requests['throttled']} with Retry-After")
+    if len(requests['endpoints']) > 1:
+        print("LLM endpoints: " + ", ".join(
+            f"{e['url']} {e['requests']} requests{'' if e['healthy'] else ' (down)'}"
+            + (f", ejected {e['ejections']}x" if e['ejections'] else "")
+            for e in requests['endpoints']))
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,229 @@
+"""
+Minimal Prometheus metrics (text exposition format 0.0.4), no client library needed.
+
+Metrics defined here are process-wide and updated where the work happens
+(LLMClient for LLM requests, the Flask hooks in server.py for routes).
+Values that already live elsewhere (LLMClient.request_stats(), cache stats) are
+read at scrape time by collectors registered with REGISTRY.add_collector().
+"""
+import math
+import threading
+
+# Seconds; LLM calls range from a cached short line to a long batch
+LLM_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + list(extra or [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} takes labels {self.label_names}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LLM_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry["counts"][i] += 1
+                    break
+            entry["sum"] += value
+            entry["count"] += 1
+
+    def render(self):
+        with self._lock:
+            items = sorted((key, dict(entry, counts=list(entry["counts"]))) for key, entry in self._values.items())
+        lines = self.header()
+        for key, entry in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, entry["counts"]):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, [('le', _number(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(entry['sum'])}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {entry['count']}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _add(self, metric):
+        with self._lock:
+            # Module reloads and repeated definitions get the existing metric back
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self._add(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LLM_BUCKETS):
+        return self._add(Histogram(name, help_text, labels, buckets))
+
+    def add_collector(self, collect):
+        """
+        collect() is called on every scrape and returns metrics to render with the rest
+        (e.g. Gauges filled from current state).
+        """
+        with self._lock:
+            self._collectors.append(collect)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        for collect in collectors:
+            try:
+                for metric in collect():
+                    lines.extend(metric.render())
+            except Exception as e:
+                lines.append(f"# collector error: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LLM_LATENCY = REGISTRY.histogram("llm_request_duration_seconds",
+                                 "LLM chat completion latency (streams: until the last token), by calling method",
+                                 labels=("method",))
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by the server, by calling method and kind (prompt/completion)",
+                              labels=("method", "kind"))
+LLM_ERRORS = REGISTRY.counter("llm_request_errors_total", "LLM requests that failed after retries, by calling method and error type",
+                              labels=("method", "error"))
+HTTP_LATENCY = REGISTRY.histogram("http_request_duration_seconds",
+                                  "Review server request latency (streamed responses: until the headers), by route",
+                                  labels=("route", "method", "status"), buckets=HTTP_BUCKETS)
+
+
+def llm_collector(llm):
+    """Collector exposing LLMClient counters, translate_batch paths, cache and per-endpoint state."""
+    def collect():
+        stats = llm.request_stats()
+        requests = Counter("llm_requests_total", "LLM requests sent (cache misses)")
+        requests.inc(stats["requests"])
+        retries = Counter("llm_retries_total", "LLM requests sent again after an overload response")
+        retries.inc(stats["retries"])
+        context = Counter("llm_context_fit_total", "Requests adjusted to fit MAX_MODEL_LEN, by action", labels=("action",))
+        for action in ("input_truncated", "output_clamped", "over_context", "finish_length"):
+            context.inc(stats[action], action=action)
+        paths = Counter("llm_translate_batch_path_total",
+                        "translate_batch outcomes: whole batches, splits, halves and single-line fallbacks", labels=("path",))
+        for path in ("whole", "split", "part", "line", "line_failed"):
+            paths.inc(stats[f"batch_{path}"], path=path)
+
+        limit = Gauge("llm_concurrency_limit", "Adaptive in-flight limit per endpoint", labels=("endpoint",))
+        in_flight = Gauge("llm_in_flight", "LLM requests in flight per endpoint", labels=("endpoint",))
+        queued = Gauge("llm_queued", "Requests waiting for a slot per endpoint", labels=("endpoint",))
+        healthy = Gauge("llm_endpoint_healthy", "1 if the endpoint passes health checks", labels=("endpoint",))
+        overloads = Counter("llm_overloads_total", "Overload responses (429/5xx/timeouts) per endpoint", labels=("endpoint",))
+        for endpoint in stats["endpoints"]:
+            url = endpoint["url"]
+            limit.set(endpoint["limit"], endpoint=url)
+            in_flight.set(endpoint["in_flight"], endpoint=url)
+            queued.set(endpoint["queued"], endpoint=url)
+            healthy.set(1 if endpoint["healthy"] else 0, endpoint=url)
+            overloads.inc(endpoint["overloads"], endpoint=url)
+        metrics = [requests, retries, context, paths, limit, in_flight, queued, healthy, overloads]
+
+        cache = llm.cache_stats()
+        if cache:
+            lookups = Counter("llm_cache_lookups_total", "LLM response cache lookups by result", labels=("result",))
+            lookups.inc(cache["hits"], result="hit")
+            lookups.inc(cache["misses"], result="miss")
+            hit_rate = Gauge("llm_cache_hit_ratio", "LLM response cache hits / lookups since start")
+            hit_rate.set(cache["hit_rate"])
+            entries = Gauge("llm_cache_entries", "Entries in the LLM response cache")
+            entries.set(cache["entries"])
+            metrics += [lookups, hit_rate, entries]
+        return metrics
+    return collect
+
+
+def suggestions_collector(service):
+    """Collector for SuggestionService counters (machine translation suggestions)."""
+    def collect():
+        stats = service.stats_snapshot()
+        requests = Counter("suggestion_requests_total", "Suggestion requests by outcome", labels=("provider", "outcome"))
+        for outcome in ("cache_hits", "deduplicated", "translated", "errors"):
+            requests.inc(stats[outcome], provider=stats["provider"], outcome=outcome)
+        in_flight = Gauge("suggestion_in_flight", "Suggestion texts being translated")
+        in_flight.set(stats["in_flight"])
+        return [requests, in_flight]
+    return collect
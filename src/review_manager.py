@@ -1,69 +1,367 @@
+import bisect
 import json
 import os
+import sqlite3
+import threading
 import uuid
+from src.glossary_matcher import find_relevant_terms, glossary_changed
+
+SEGMENT_COLUMNS = ("id", "chapter", "jp", "zh", "status")
 
 class ReviewManager:
+    """
+    Review session storage.
+    Segments live in work_dir/session.db (SQLite, WAL mode), one row per segment,
+    so saving an edit touches a single row instead of rewriting the whole session.
+    session.json is kept as the interchange format: it is imported automatically
+    when no database exists yet, and export_json() writes it back out.
+
+    The session is also held in memory (metadata, ordered segments and an
+    id -> segment index), loaded on first use. is_stale() tells a long-lived
+    instance when another process has written to the database since then.
+    """
+
     def __init__(self, work_dir):
         self.work_dir = work_dir
         self.session_file = os.path.join(work_dir, "session.json")
-        self.session_data = self._load_session()
+        self.db_file = os.path.join(work_dir, "session.db")
+        self._lock = threading.RLock()
+        self._meta = None
+        self._segments = None
+        self._index = None
+        self._chapters = None
+        self._snapshot = None
+        self._signature = None
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        self._conn = self._connect()
+        if not self.has_session() and os.path.exists(self.session_file):
+            self.import_json(self.session_file)
 
-    def _load_session(self):
-        if os.path.exists(self.session_file):
-            with open(self.session_file, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        return {"project_name": "", "segments": []}
+    def _connect(self):
+        conn = sqlite3.connect(self.db_file, check_same_thread=False, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                seq INTEGER PRIMARY KEY,
+                id TEXT NOT NULL,
+                chapter TEXT NOT NULL,
+                jp TEXT NOT NULL,
+                zh TEXT NOT NULL DEFAULT '',
+                status TEXT NOT NULL DEFAULT 'pending',
+                extra TEXT
+            );
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_segments_id ON segments(id);
+            CREATE INDEX IF NOT EXISTS idx_segments_chapter ON segments(chapter, seq);
+        """)
+        return conn
 
-    def save_session(self):
-        with open(self.session_file, 'w', encoding='utf-8') as f:
-            json.dump(self.session_data, f, ensure_ascii=False, indent=2)
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    # --- In-memory state ---
 
-    def create_session(self, project_name, segments, glossary_map, src_lang="Japanese", tgt_lang="Traditional Chinese"):
+    def file_signature(self):
+        """(mtime, size) of the database and its WAL file; changes whenever anyone commits."""
+        sig = []
+        for path in (self.db_file, self.db_file + "-wal"):
+            try:
+                st = os.stat(path)
+                sig.append((st.st_mtime_ns, st.st_size))
+            except FileNotFoundError:
+                sig.append(None)
+        return tuple(sig)
+
+    def is_stale(self):
+        """True if the database changed on disk since we loaded it or last wrote to it."""
+        # Under the lock, so one of our own writes cannot be seen between commit and bookkeeping
+        with self._lock:
+            return self._signature is not None and self._signature != self.file_signature()
+
+    def reload(self):
+        """
+        Re-reads the session from the database. The new state replaces the old one in a
+        single step under the lock, so requests running meanwhile see either of them,
+        never a half-cleared one.
         """
-        Initializes a new session.
+        with self._lock:
+            self._load()
+
+    def _load(self):
+        meta = {k: json.loads(v) for k, v in self._conn.execute("SELECT key, value FROM meta")}
+        rows = self._conn.execute("SELECT id, chapter, jp, zh, status, extra FROM segments ORDER BY seq").fetchall()
+        segments = [self._segment_dict(row) for row in rows]
+        index = {seg["id"]: seg for seg in segments}
+        chapters = {}
+        for pos, seg in enumerate(segments):
+            chapters.setdefault(seg["chapter"], []).append(pos)
+        self._meta = meta
+        self._index = index
+        self._chapters = chapters
+        self._snapshot = None
+        self._signature = self.file_signature()
+        # Assigned last: readers only check _segments before using the rest
+        self._segments = segments
+
+    def _ensure_loaded(self):
+        if self._segments is not None:
+            return
+        with self._lock:
+            if self._segments is None:
+                self._load()
+
+    def _view(self):
+        """(segments, index, chapters) from the same load; a reload() in between cannot mix them."""
+        self._ensure_loaded()
+        with self._lock:
+            return self._segments, self._index, self._chapters
+
+    def _committed(self):
+        # Our own writes must not make us look stale
+        self._snapshot = None
+        if self._segments is not None:
+            self._signature = self.file_signature()
+
+    # --- Session level ---
+
+    def has_session(self):
+        with self._lock:
+            return self._conn.execute("SELECT 1 FROM meta WHERE key = 'project_name'").fetchone() is not None
+
+    def create_session(self, project_name, segments, glossary_map, src_lang="Japanese", tgt_lang="Traditional Chinese", meta=None):
+        """
+        Initializes a new session, replacing any existing one.
         segments: list of {"id": str, "jp": str, "zh": str, "status": "pending"}
         glossary_map: complete glossary dict
+        meta: extra session metadata stored with it (e.g. the source EPUB's hash)
         """
-        self.session_data = {
+        data = dict(meta or {})
+        data.update({
             "project_name": project_name,
             "src_lang": src_lang,
             "tgt_lang": tgt_lang,
             "glossary": glossary_map,
             "segments": segments
-        }
-        self.save_session()
+        })
+        self._replace_all(data)
+
+    def _replace_all(self, data):
+        with self._lock:
+            with self._conn:
+                self._conn.execute("DELETE FROM meta")
+                self._conn.execute("DELETE FROM segments")
+                self._conn.executemany(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)",
+                    [(k, json.dumps(v, ensure_ascii=False)) for k, v in data.items() if k != "segments"])
+                self._conn.executemany(
+                    "INSERT INTO segments (seq, id, chapter, jp, zh, status, extra) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    [self._segment_row(i, seg) for i, seg in enumerate(data.get("segments", []))])
+            self.reload()
+
+    @staticmethod
+    def _segment_row(seq, seg):
+        extra = {k: v for k, v in seg.items() if k not in SEGMENT_COLUMNS and k != "glossary_matches"}
+        return (seq, seg.get("id") or str(uuid.uuid4()), seg.get("chapter", ""), seg.get("jp", ""),
+                seg.get("zh") or "", seg.get("status") or "pending",
+                json.dumps(extra, ensure_ascii=False) if extra else None)
+
+    @staticmethod
+    def _segment_dict(row):
+        seg = dict(zip(SEGMENT_COLUMNS, row[:5]))
+        if row[5]:
+            seg.update(json.loads(row[5]))
+        return seg
+
+    def get_meta(self, key, default=None):
+        self._ensure_loaded()
+        return self._meta.get(key, default)
+
+    def set_meta(self, key, value):
+        self._ensure_loaded()
+        with self._lock:
+            with self._conn:
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                                   (key, json.dumps(value, ensure_ascii=False)))
+            self._meta[key] = value
+            self._committed()
+
+    def get_glossary(self):
+        # Returns the same dict object until it changes, so the glossary matcher cache stays warm
+        self._ensure_loaded()
+        return self._meta.setdefault("glossary", {})
+
+    def set_glossary(self, glossary_map):
+        self.set_meta("glossary", glossary_map)
+        # The caller may have edited the same dict it passes back in
+        glossary_changed(glossary_map)
+
+    @property
+    def session_data(self):
+        """
+        The whole session as a session.json-style dict.
+        Built on first access; prefer the row-level methods for edits.
+        """
+        if self._snapshot is None:
+            self._ensure_loaded()
+            with self._lock:
+                data = {"project_name": ""}
+                data.update(self._meta)
+                data["segments"] = self.get_all_segments()
+            self._snapshot = data
+        return self._snapshot
+
+    def save_session(self):
+        """Writes the (possibly modified) session_data dict back in full."""
+        if self._snapshot is not None:
+            self._replace_all(self._snapshot)
+
+    def import_json(self, path=None):
+        """Loads a session.json file into the database, replacing the current session."""
+        with open(path or self.session_file, 'r', encoding='utf-8') as f:
+            self._replace_all(json.load(f))
+
+    def export_json(self, path=None):
+        """Writes the session in the session.json format (atomically via a temp file)."""
+        path = path or self.session_file
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.session_data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+        return path
+
+    # --- Segment level ---
 
     def get_segment(self, segment_id):
-        for seg in self.session_data["segments"]:
-            if seg["id"] == segment_id:
-                # Enrich with glossary matches for UI
-                matches = {}
-                for term, trans in self.session_data["glossary"].items():
-                    if term in seg["jp"]:
-                        matches[term] = trans
-                seg["glossary_matches"] = matches
-                return seg
-        return None
+        _, index, _ = self._view()
+        seg = index.get(segment_id)
+        if seg is None:
+            return None
+        # Enrich with glossary matches for UI
+        return dict(seg, glossary_matches=find_relevant_terms(seg["jp"], self.get_glossary()))
+
+    def _update_segment(self, segment_id, column, value):
+        self._ensure_loaded()
+        with self._lock:
+            seg = self._index.get(segment_id)
+            if seg is None:
+                return False
+            with self._conn:
+                self._conn.execute(f"UPDATE segments SET {column} = ? WHERE id = ?", (value, segment_id))
+            seg[column] = value
+            self._committed()
+        return True
 
     def update_segment_translation(self, segment_id, new_zh):
-        for seg in self.session_data["segments"]:
-            if seg["id"] == segment_id:
-                seg["zh"] = new_zh
-                self.save_session()
-                return True
-        return False
+        return self._update_segment(segment_id, "zh", new_zh)
+
+    def fill_segment_translation(self, segment_id, new_zh):
+        """
+        Sets a draft translation only if the segment is still untranslated and unapproved,
+        so background pre-fill never overwrites the reviewer's work. Returns True if written.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            seg = self._index.get(segment_id)
+            if seg is None or seg["zh"] or seg["status"] == "approved":
+                return False
+            return self._update_segment(segment_id, "zh", new_zh)
+
+    def fill_segment_translations(self, translations, replace_unapproved=False):
+        """
+        Bulk fill_segment_translation: {segment_id: zh} written in a single transaction,
+        so a crash leaves either all or none of them. Returns the number written.
+        replace_unapproved: also replace existing drafts. Approved segments are never
+        written, checked under the lock so an approval made meanwhile still wins.
+        """
+        self._ensure_loaded()
+        with self._lock:
+            rows = [(zh, seg_id) for seg_id, zh in translations.items()
+                    if seg_id in self._index and (replace_unapproved or not self._index[seg_id]["zh"])
+                    and self._index[seg_id]["status"] != "approved"]
+            if not rows:
+                return 0
+            with self._conn:
+                self._conn.executemany("UPDATE segments SET zh = ? WHERE id = ?", rows)
+            for zh, seg_id in rows:
+                self._index[seg_id]["zh"] = zh
+            self._committed()
+        return len(rows)
 
     def approve_segment(self, segment_id):
-        for seg in self.session_data["segments"]:
-            if seg["id"] == segment_id:
-                seg["status"] = "approved"
-                self.save_session()
-                return True
-        return False
+        return self._update_segment(segment_id, "status", "approved")
 
     def get_all_segments(self):
-        return self.session_data["segments"]
+        self._ensure_loaded()
+        with self._lock:
+            return [dict(seg) for seg in self._segments]
+
+    def status_counts(self):
+        """{"total": n, "<status>": n, ...} over the whole session."""
+        segments, _, _ = self._view()
+        counts = {"total": len(segments), "approved": 0, "pending": 0}
+        for seg in segments:
+            counts[seg["status"]] = counts.get(seg["status"], 0) + 1
+        return counts
+
+    def list_chapters(self):
+        """Chapters in book order, each with its segment and status counts."""
+        segments, _, chapter_positions = self._view()
+        chapters = []
+        for chapter, positions in chapter_positions.items():
+            segs = [segments[pos] for pos in positions]
+            chapters.append({
+                "chapter": chapter,
+                "total": len(segs),
+                "approved": sum(1 for seg in segs if seg["status"] == "approved"),
+                "translated": sum(1 for seg in segs if seg["zh"]),
+                "first_index": positions[0],
+            })
+        return chapters
+
+    def list_segments(self, chapter=None, status=None, cursor=0, limit=100):
+        """
+        One page of segments in book order, optionally restricted to a chapter and/or status.
+        cursor is the book-order index to start from; returns (segments, next_cursor),
+        where next_cursor is None after the last page. Each segment carries its
+        book-order "index" and its "glossary_matches".
+        """
+        segments, _, chapters = self._view()
+        if chapter is not None:
+            positions = chapters.get(chapter, [])
+            positions = positions[bisect.bisect_left(positions, cursor):]
+        else:
+            positions = range(max(cursor, 0), len(segments))
+        glossary = self.get_glossary()
+        page = []
+        next_cursor = None
+        for pos in positions:
+            seg = segments[pos]
+            if status is not None and seg["status"] != status:
+                continue
+            if len(page) >= limit:
+                next_cursor = pos
+                break
+            page.append(dict(seg, index=pos, glossary_matches=find_relevant_terms(seg["jp"], glossary)))
+        return page, next_cursor
+
+    def find_segments(self, chapter=None, status=None, untranslated=False):
+        """Segments (copies, book order) matching a chapter and/or status; untranslated=True keeps only empty 'zh'."""
+        self._ensure_loaded()
+        with self._lock:
+            if chapter is not None:
+                segs = [self._segments[pos] for pos in self._chapters.get(chapter, [])]
+            else:
+                segs = self._segments
+            return [dict(seg) for seg in segs
+                    if (status is None or seg["status"] == status) and (not untranslated or not seg["zh"])]
 
     def export_content(self):
         """Returns the full translated text (list of paragraphs)."""
-        return [seg["zh"] for seg in self.session_data["segments"]]
+        segments, _, _ = self._view()
+        return [seg["zh"] for seg in segments]
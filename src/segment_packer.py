@@ -0,0 +1,82 @@
+import os
+from src.tokens import estimate_tokens
+
+
+class SegmentPacker:
+    """
+    Groups consecutive segments of the same chapter into batches for LLMClient.translate_batch.
+
+    Each batch is sized so that its source tokens, plus the expected translation
+    (source * output_expansion) and a fixed reserve for the system prompt and glossary,
+    fit into the model context (MAX_MODEL_LEN) and into the completion limit.
+    The default reserve covers the rules plus the largest glossary LLMClient puts in
+    the shared prompt prefix (LLM_PREFIX_GLOSSARY_TOKENS).
+    """
+
+    def __init__(self, max_model_len=None, output_expansion=1.5, prompt_reserve=None,
+                 max_output_tokens=4096, max_segments=40, count_tokens=None):
+        self.max_model_len = int(max_model_len or os.getenv("MAX_MODEL_LEN", "8192"))
+        self.output_expansion = output_expansion
+        if prompt_reserve is None:
+            prompt_reserve = 512 + int(os.getenv("LLM_PREFIX_GLOSSARY_TOKENS", "1536"))
+        self.prompt_reserve = prompt_reserve
+        self.max_output_tokens = max_output_tokens
+        self.max_segments = max_segments
+        self.count_tokens = count_tokens or estimate_tokens
+
+        # Source tokens we can afford per request
+        context_budget = (self.max_model_len - prompt_reserve) / (1 + output_expansion)
+        output_budget = max_output_tokens / output_expansion
+        self.token_budget = max(1, int(min(context_budget, output_budget)))
+
+    def pack(self, segments):
+        """
+        Returns (batches, stats). batches is a list of segment lists in original order.
+        A segment whose text spans several lines always gets a batch of its own, because
+        translate_batch sends one line per input.
+        """
+        batches = []
+        fills = []
+        current = []
+        current_tokens = 0
+
+        def flush():
+            nonlocal current, current_tokens
+            if current:
+                batches.append(current)
+                fills.append(current_tokens / self.token_budget)
+            current = []
+            current_tokens = 0
+
+        for seg in segments:
+            tokens = self.count_tokens(seg["jp"]) + 1  # +1 for the line separator
+            multiline = "\n" in seg["jp"]
+            if current and (
+                multiline
+                or seg["chapter"] != current[-1]["chapter"]
+                or len(current) >= self.max_segments
+                or current_tokens + tokens > self.token_budget
+            ):
+                flush()
+            current.append(seg)
+            current_tokens += tokens
+            if multiline:
+                flush()
+        flush()
+
+        stats = {
+            "segments": len(segments),
+            "batches": len(batches),
+            "token_budget": self.token_budget,
+            "avg_segments": len(segments) / len(batches) if batches else 0.0,
+            "avg_fill": sum(fills) / len(fills) if fills else 0.0,
+            "min_fill": min(fills) if fills else 0.0,
+            "max_fill": max(fills) if fills else 0.0,
+        }
+        return batches, stats
+
+
+def format_pack_stats(stats):
+    return (f"Packed {stats['segments']} segments into {stats['batches']} batches "
+            f"(budget {stats['token_budget']} tokens, {stats['avg_segments']:.1f} segments/batch, "
+            f"fill avg {stats['avg_fill']:.0%} min {stats['min_fill']:.0%} max {stats['max_fill']:.0%})")
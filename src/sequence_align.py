@@ -0,0 +1,185 @@
+import math
+import re
+import numpy as np
+
+# Features that usually survive translation between CJK languages unchanged:
+# dialogue brackets, sentence-final marks, ellipses/dashes and numerals.
+PROFILE_PATTERNS = [
+    re.compile(r'[「『]'),
+    re.compile(r'[」』]'),
+    re.compile(r'[！!]'),
+    re.compile(r'[？?]'),
+    re.compile(r'…+|\.\.\.'),
+    re.compile(r'[―—─]+'),
+    re.compile(r'[0-9０-９]+'),
+]
+
+# Alignment moves: (source items consumed, reference items consumed)
+MOVES = {
+    "1-1": (1, 1),
+    "2-1": (2, 1),
+    "1-2": (1, 2),
+    "1-0": (1, 0),
+    "0-1": (0, 1),
+}
+
+
+def profile(texts):
+    """
+    Feature matrix for a list of texts: column 0 is the character count,
+    the other columns count each PROFILE_PATTERNS match.
+    """
+    feats = np.zeros((len(texts), len(PROFILE_PATTERNS) + 1), dtype=np.float64)
+    for i, text in enumerate(texts):
+        feats[i, 0] = len(text)
+        for k, pattern in enumerate(PROFILE_PATTERNS):
+            feats[i, k + 1] = len(pattern.findall(text))
+    return feats
+
+
+def pair_cost(src, ref, ratio, smoothing=5.0, profile_weight=1.0):
+    """
+    Cost matrix [len(src), len(ref)] of pairing source rows with reference rows
+    (feature matrices from profile()). Lower is more likely a translation pair:
+      - length term: |log| of the length ratio, after scaling the source by the
+        book-wide ratio (translations are consistently longer or shorter)
+      - profile term: normalised L1 distance of the punctuation/numeral counts
+    """
+    src_len = src[:, 0:1] * ratio + smoothing
+    ref_len = ref[None, :, 0] + smoothing
+    cost = np.abs(np.log(src_len / ref_len))
+    if src.shape[1] > 1 and profile_weight:
+        a = src[:, None, 1:]
+        b = ref[None, :, 1:]
+        diff = np.abs(a - b).sum(axis=2)
+        total = (a + b).sum(axis=2)
+        cost += profile_weight * diff / (total + 2.0)
+    return cost
+
+
+def length_ratio(src, ref):
+    """Book-wide target/source length ratio from two feature matrices."""
+    src_total = src[:, 0].sum()
+    ref_total = ref[:, 0].sum()
+    if not src_total or not ref_total:
+        return 1.0
+    return float(ref_total / src_total)
+
+
+def align_sequences(src, ref, ratio=None, skip_cost=1.0, merge_cost=0.3, allow_merges=True, **cost_args):
+    """
+    Monotonic alignment of two feature sequences by dynamic programming
+    (Gale-Church style, with 1-1, 2-1, 1-2 and skip moves).
+
+    The table is filled one source row at a time with NumPy: the diagonal and
+    vertical moves only depend on earlier rows, and the horizontal (reference skip)
+    move within a row is resolved with a running minimum, so each row costs a few
+    vector operations instead of a Python loop over the reference.
+
+    Returns a list of links in order: (src_indices, ref_indices, move, cost), where
+    the indices are lists (empty for skipped items) and cost is that link's cost.
+    """
+    n, m = len(src), len(ref)
+    if ratio is None:
+        ratio = length_ratio(src, ref)
+    merge_src = allow_merges and n > 1
+    merge_ref = allow_merges and m > 1
+    if merge_ref:
+        ref2 = ref[1:] + ref[:-1]  # column j-1 holds items (j-1, j)
+
+    inf = np.inf
+    move_codes = list(MOVES)
+    D = np.full((n + 1, m + 1), inf)
+    # back[i, j]: index into move_codes of the best non-horizontal move; -1 if horizontal wins
+    back = np.full((n + 1, m + 1), -1, dtype=np.int8)
+    D[0, :] = skip_cost * np.arange(m + 1)
+    cols = np.arange(m + 1)
+
+    for i in range(1, n + 1):
+        # Pair costs are computed one source row at a time, so memory stays O(n * m) for D only
+        row_src = src[i - 1:i]
+        prev = D[i - 1]
+        cand = np.full((len(move_codes), m + 1), inf)
+        cand[move_codes.index("1-1"), 1:] = prev[:-1] + pair_cost(row_src, ref, ratio, **cost_args)[0]
+        cand[move_codes.index("1-0"), :] = prev + skip_cost
+        if merge_src and i > 1:
+            c21 = pair_cost(src[i - 2:i - 1] + row_src, ref, ratio, **cost_args)[0] + merge_cost
+            cand[move_codes.index("2-1"), 1:] = D[i - 2, :-1] + c21
+        if merge_ref:
+            c12 = pair_cost(row_src, ref2, ratio, **cost_args)[0] + merge_cost
+            cand[move_codes.index("1-2"), 2:] = prev[:-2] + c12
+        best = cand.argmin(axis=0)
+        row = cand[best, cols]
+        # Horizontal moves: D[i, j] = min over k <= j of row[k] + skip_cost * (j - k)
+        running = np.minimum.accumulate(row - skip_cost * cols) + skip_cost * cols
+        # Small tolerance: row - x + x can round below row and fake a skip
+        horizontal = running < row - 1e-9
+        D[i] = np.where(horizontal, running, row)
+        back[i] = np.where(horizontal, -1, best)
+
+    links = []
+    i, j = n, m
+    while i > 0 or j > 0:
+        code = back[i, j]
+        if code < 0 or i == 0:
+            links.append(([], [j - 1], "0-1", skip_cost))
+            j -= 1
+            continue
+        move = move_codes[code]
+        di, dj = MOVES[move]
+        cost = D[i, j] - D[i - di, j - dj]
+        links.append((list(range(i - di, i)), list(range(j - dj, j)), move, float(cost)))
+        i, j = i - di, j - dj
+    links.reverse()
+    return links
+
+
+def confidence(cost):
+    """Maps a link cost to (0, 1]; 1.0 is a perfect length and profile match."""
+    return math.exp(-cost)
+
+
+def aligned_windows(src_paras, ref_paras, min_confidence=0.6, max_chars=1500, min_chars=200, min_links=3, ratio=None):
+    """
+    Aligns two paragraph lists and groups consecutive high-confidence links into
+    parallel windows of up to max_chars source characters.
+    A window ends at any skipped or low-confidence link, so every window only
+    contains text whose counterpart was verified. Windows shorter than min_chars
+    or with fewer than min_links links are dropped.
+    Returns a list of {"source_text", "ref_text", "confidence", "source_range"}.
+    """
+    if not src_paras or not ref_paras:
+        return []
+    links = align_sequences(profile(src_paras), profile(ref_paras), ratio=ratio)
+    windows = []
+    current = []
+
+    def flush():
+        if not current:
+            return
+        src_idx = [k for link in current for k in link[0]]
+        source_text = "\n".join(src_paras[k] for k in src_idx)
+        if len(current) >= min_links and len(source_text) >= min_chars:
+            windows.append({
+                "source_text": source_text,
+                "ref_text": "\n".join(ref_paras[k] for link in current for k in link[1]),
+                "confidence": round(min(confidence(link[3]) for link in current), 3),
+                "source_range": [src_idx[0], src_idx[-1] + 1],
+            })
+        current.clear()
+
+    size = 0
+    for link in links:
+        src_idx, ref_idx, move, cost = link
+        if not src_idx or not ref_idx or confidence(cost) < min_confidence:
+            flush()
+            size = 0
+            continue
+        link_size = sum(len(src_paras[k]) + 1 for k in src_idx)
+        if current and size + link_size > max_chars:
+            flush()
+            size = 0
+        current.append(link)
+        size += link_size
+    flush()
+    return windows
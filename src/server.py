@@ -1,22 +1,76 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, Response, g, jsonify, request, send_from_directory, stream_with_context
 import os
 import sys
 import json
+import threading
+import time
 
 # Add src to path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from src.review_manager import ReviewManager
 from src.llm_client import LLMClient
-from deep_translator import GoogleTranslator
+from src.jobs import JobManager
+from src import metrics
+from src.suggestions import SuggestionService, language_code
 
 app = Flask(__name__, static_url_path='')
 WORK_DIR = "/app/work_session" # runtime mapping
-# manager = ReviewManager(WORK_DIR) <-- REMOVED global instance to avoid stale state
 # Initialize LLM with model from env var if set
 model_name = os.getenv("LLM_MODEL", "Qwen/Qwen2.5-7B-Instruct")
 llm = LLMClient(model=model_name)
 print(f"Server initialized with model: {model_name}")
+metrics.REGISTRY.add_collector(metrics.llm_collector(llm))
+
+# One shared session for all requests. It is reloaded only when session.db changes
+# on disk (e.g. `prepare` re-run in another container), so request latency does not
+# grow with book size.
+_manager = None
+_manager_lock = threading.Lock()
+
+def get_manager():
+    global _manager
+    with _manager_lock:
+        if _manager is None or _manager.work_dir != WORK_DIR:
+            _manager = ReviewManager(WORK_DIR)
+        elif _manager.is_stale():
+            print("Session changed on disk, reloading...")
+            _manager.reload()
+        return _manager
+
+# Machine translation suggestions (/api/google), created on first use so a missing
+# backend library only affects that button
+_suggestions = None
+_suggestions_lock = threading.Lock()
+
+def get_suggestions():
+    global _suggestions
+    with _suggestions_lock:
+        if _suggestions is None:
+            _suggestions = SuggestionService.from_env()
+            metrics.REGISTRY.add_collector(metrics.suggestions_collector(_suggestions))
+        return _suggestions
+
+# Background translation jobs share one worker pool and write through the shared session
+jobs = JobManager(get_manager, llm, workers=int(os.getenv("JOB_WORKERS") or llm.max_concurrency))
+
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_latency(response):
+    start = g.get("request_start")
+    if start is not None:
+        # Route pattern, not the path, so segment ids do not each get their own series
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        metrics.HTTP_LATENCY.observe(time.perf_counter() - start, route=route,
+                                     method=request.method, status=response.status_code)
+    return response
+
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
 
 @app.route('/')
 def root():
@@ -24,13 +78,48 @@ def root():
 
 @app.route('/api/session', methods=['GET'])
 def get_session():
-    # Reload in case it changed
-    manager = ReviewManager(WORK_DIR)
+    manager = get_manager()
     return jsonify(manager.session_data)
 
+@app.route('/api/session/summary', methods=['GET'])
+def get_session_summary():
+    # Everything the UI needs on first paint, without segments or glossary
+    manager = get_manager()
+    return jsonify({
+        "project_name": manager.get_meta("project_name", ""),
+        "src_lang": manager.get_meta("src_lang", "Japanese"),
+        "tgt_lang": manager.get_meta("tgt_lang", "Traditional Chinese"),
+        "counts": manager.status_counts(),
+    })
+
+@app.route('/api/chapters', methods=['GET'])
+def get_chapters():
+    manager = get_manager()
+    return jsonify(manager.list_chapters())
+
+@app.route('/api/segments', methods=['GET'])
+def get_segments():
+    """
+    Paginated segments: ?chapter=...&status=pending|approved&cursor=<index>&limit=<n>
+    Returns {"segments": [...], "next_cursor": <index or null>}.
+    """
+    manager = get_manager()
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 50)), 1), 500)
+    except ValueError:
+        return jsonify({"error": "cursor and limit must be integers"}), 400
+    segments, next_cursor = manager.list_segments(
+        chapter=request.args.get('chapter') or None,
+        status=request.args.get('status') or None,
+        cursor=cursor,
+        limit=limit,
+    )
+    return jsonify({"segments": segments, "next_cursor": next_cursor})
+
 @app.route('/api/segment/<seg_id>', methods=['POST'])
 def update_segment(seg_id):
-    manager = ReviewManager(WORK_DIR) # Load latest state
+    manager = get_manager()
     data = request.json
     if 'zh' in data:
         manager.update_segment_translation(seg_id, data['zh'])
@@ -40,19 +129,19 @@ def update_segment(seg_id):
 
 @app.route('/api/translate/<seg_id>', methods=['POST'])
 def translate_segment(seg_id):
-    manager = ReviewManager(WORK_DIR) # Load latest state
+    manager = get_manager()
     seg = manager.get_segment(seg_id)
     if not seg:
         return jsonify({"error": "Segment not found"}), 404
     
     # Run translation efficiently
-    glossary = manager.session_data.get("glossary", {})
-    src_lang = manager.session_data.get("src_lang", "Japanese")
-    tgt_lang = manager.session_data.get("tgt_lang", "Traditional Chinese")
+    glossary = manager.get_glossary()
+    src_lang = manager.get_meta("src_lang", "Japanese")
+    tgt_lang = manager.get_meta("tgt_lang", "Traditional Chinese")
     
     try:
-        # Use new optimized single translation
-        new_text = llm.translate_single(seg["jp"], glossary, src_lang, tgt_lang)
+        # Use new optimized single translation; a click means "regenerate", so skip the cached answer
+        new_text = llm.translate_single(seg["jp"], glossary, src_lang, tgt_lang, use_cache=False)
         if new_text:
             # Auto-save draft
             manager.update_segment_translation(seg_id, new_text)
@@ -62,12 +151,82 @@ def translate_segment(seg_id):
         
     return jsonify({"error": "Translation failed"}), 500
 
+@app.route('/api/translate/<seg_id>/stream', methods=['POST'])
+def translate_segment_stream(seg_id):
+    """
+    Server-Sent Events variant of /api/translate/<seg_id>.
+    Emits `data: {"delta": "..."}` as tokens arrive, then `event: done` with the
+    final {"zh": "..."} once it has been auto-saved, or `event: error`.
+    """
+    manager = get_manager()
+    seg = manager.get_segment(seg_id)
+    if not seg:
+        return jsonify({"error": "Segment not found"}), 404
+
+    glossary = manager.get_glossary()
+    src_lang = manager.get_meta("src_lang", "Japanese")
+    tgt_lang = manager.get_meta("tgt_lang", "Traditional Chinese")
+
+    def sse(payload, event=None):
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    def generate():
+        parts = []
+        try:
+            for delta in llm.translate_single_stream(seg["jp"], glossary, src_lang, tgt_lang, use_cache=False):
+                parts.append(delta)
+                yield sse({"delta": delta})
+        except Exception as e:
+            yield sse({"error": str(e)}, event="error")
+            return
+        new_text = "".join(parts).strip()
+        if not new_text:
+            yield sse({"error": "Translation failed"}, event="error")
+            return
+        # Auto-save draft
+        manager.update_segment_translation(seg_id, new_text)
+        yield sse({"zh": new_text}, event="done")
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/api/jobs', methods=['POST'])
+def start_job():
+    """
+    Starts a background translation job.
+    Body: {"chapter": "...", "status": "pending", "overwrite": false}
+    Without overwrite, only untranslated segments are filled; approved segments are never touched.
+    """
+    data = request.json or {}
+    if not data.get('chapter') and not data.get('status'):
+        return jsonify({"error": "Provide a chapter and/or a status filter"}), 400
+    job = jobs.start(chapter=data.get('chapter'), status=data.get('status'), overwrite=bool(data.get('overwrite')))
+    return jsonify(job.to_dict()), 202
+
+@app.route('/api/jobs', methods=['GET'])
+def list_jobs():
+    return jsonify([job.to_dict() for job in jobs.list()])
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    job = jobs.cancel(job_id)
+    if not job:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
 @app.route('/api/glossary', methods=['GET'])
 def get_glossary():
     # Load glossary directly from the active SESSION for consistency with UI
-    manager = ReviewManager(WORK_DIR) # Force reload
-    session_glossary = manager.session_data.get("glossary", {})
-    return jsonify(session_glossary)
+    manager = get_manager()
+    return jsonify(manager.get_glossary())
 
 @app.route('/api/glossary', methods=['POST'])
 def save_glossary():
@@ -75,9 +234,8 @@ def save_glossary():
     new_glossary = request.json
     
     # 1. Update active session
-    manager = ReviewManager(WORK_DIR)
-    manager.session_data["glossary"] = new_glossary
-    manager.save_session()
+    manager = get_manager()
+    manager.set_glossary(new_glossary)
     
     # 2. Update persistent file
     glossary_path = "glossary.json" # Default
@@ -88,31 +246,44 @@ def save_glossary():
 
 @app.route('/api/google', methods=['POST'])
 def google_translate():
-    text = request.json.get('text')
+    """
+    Machine translation suggestion for one segment.
+    Body: {"id": "<segment id>"} or {"text": "..."}. Returns {"zh": "...", "cached": bool}.
+    """
+    data = request.json or {}
+    manager = get_manager()
+    text = data.get('text')
+    if not text and data.get('id'):
+        seg = manager.get_segment(data['id'])
+        text = seg["jp"] if seg else None
     if not text:
         return jsonify({"error": "No text provided"}), 400
-    # Get languages
-    manager = ReviewManager(WORK_DIR)
-    # Map friendly names to Google Codes (Simplified map, can be expanded)
-    # Default to auto -> zh-TW
-    
-    target_map = {
-        "Traditional Chinese": "zh-TW",
-        "Simplified Chinese": "zh-CN",
-        "English": "en",
-        "Japanese": "ja",
-        "Korean": "ko"
-    }
-    tgt_lang_name = manager.session_data.get("tgt_lang", "Traditional Chinese")
-    tgt_code = target_map.get(tgt_lang_name, "zh-TW")
+    tgt_code = language_code(manager.get_meta("tgt_lang", "Traditional Chinese"))
 
     try:
-        # translator = GoogleTranslator(source='ja', target='zh-TW')
         # Using auto-detect for source is usually safer
-        zh = GoogleTranslator(source='auto', target=tgt_code).translate(text)
-        return jsonify({"zh": zh})
+        zh, cached = get_suggestions().suggest(text, tgt_code)
+        return jsonify({"zh": zh, "cached": cached})
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/suggestions/prefetch', methods=['POST'])
+def prefetch_suggestions():
+    """
+    Warms the suggestion cache for a page of segments in the background.
+    Body: {"ids": ["<segment id>", ...]} (at most 500). Returns counts of cached, in-flight and queued texts.
+    """
+    ids = (request.json or {}).get('ids') or []
+    if not isinstance(ids, list) or len(ids) > 500:
+        return jsonify({"error": "ids must be a list of at most 500 segment ids"}), 400
+    manager = get_manager()
+    texts = [seg["jp"] for seg in (manager.get_segment(seg_id) for seg_id in ids) if seg]
+    tgt_code = language_code(manager.get_meta("tgt_lang", "Traditional Chinese"))
+    try:
+        counts = get_suggestions().prefetch(texts, tgt_code)
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    return jsonify(counts), 202
 
 if __name__ == '__main__':
     # Ensure static dir exists
@@ -0,0 +1,229 @@
+import abc
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from src.llm_cache import LLMCache
+
+# Friendly language names (session meta) -> machine translation language codes
+LANGUAGE_CODES = {
+    "Traditional Chinese": "zh-TW",
+    "Simplified Chinese": "zh-CN",
+    "English": "en",
+    "Japanese": "ja",
+    "Korean": "ko",
+}
+
+
+def language_code(name, default="zh-TW"):
+    return LANGUAGE_CODES.get(name, default)
+
+
+class SuggestionProvider(abc.ABC):
+    """
+    A machine translation backend for reviewer suggestions.
+    Subclasses implement translate(); translate_many() defaults to one call per text.
+    Both are called from several threads at once (request threads and prefetch workers).
+    """
+    name = None
+    # Texts translated at once by translate_many during a prefetch
+    batch_size = 1
+
+    @abc.abstractmethod
+    def translate(self, text, target, source="auto"):
+        """Returns the translation of text into the target language code."""
+
+    def translate_many(self, texts, target, source="auto"):
+        return [self.translate(text, target, source) for text in texts]
+
+
+class GoogleProvider(SuggestionProvider):
+    """
+    Google Translate through deep_translator (no API key).
+    A GoogleTranslator keeps the text of the call in progress on the instance, so one
+    cannot be shared between threads; each thread keeps its own per language pair.
+    """
+    name = "google"
+    batch_size = 1
+
+    def __init__(self):
+        try:
+            from deep_translator import GoogleTranslator
+        except ImportError:
+            raise RuntimeError("deep_translator is not installed; use SUGGESTION_PROVIDER=stub or pip install deep-translator")
+        self._cls = GoogleTranslator
+        self._local = threading.local()
+
+    def _translator(self, source, target):
+        translators = getattr(self._local, "translators", None)
+        if translators is None:
+            translators = self._local.translators = {}
+        translator = translators.get((source, target))
+        if translator is None:
+            translator = translators[(source, target)] = self._cls(source=source, target=target)
+        return translator
+
+    def translate(self, text, target, source="auto"):
+        return self._translator(source, target).translate(text)
+
+
+class StubProvider(SuggestionProvider):
+    """Offline backend for development and tests: returns the text tagged with the target code."""
+    name = "stub"
+    batch_size = 50
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def translate(self, text, target, source="auto"):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[{target}] {text}"
+
+    def translate_many(self, texts, target, source="auto"):
+        with self._lock:
+            self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return [f"[{target}] {text}" for text in texts]
+
+
+PROVIDERS = {"google": GoogleProvider, "stub": StubProvider}
+
+
+class SuggestionService:
+    """
+    Machine translation suggestions with a persistent cache and request de-duplication.
+
+    - Results are stored in an on-disk cache (the same SQLite LRU store as LLM responses),
+      keyed by provider, language pair and text, so asking again for a line is free,
+      across server restarts too.
+    - A text already being translated is not sent twice: later callers wait for the
+      request in flight (e.g. the reviewer clicks while a prefetch is still running).
+    - prefetch() translates a page of texts in the background on a small worker pool.
+    """
+
+    def __init__(self, provider, cache=None, workers=4):
+        self.provider = provider
+        self.cache = cache
+        self.stats = {"requests": 0, "cache_hits": 0, "deduplicated": 0, "translated": 0, "errors": 0}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="suggest")
+
+    @classmethod
+    def from_env(cls):
+        """Provider from SUGGESTION_PROVIDER (google, stub); cache from SUGGESTION_CACHE / SUGGESTION_CACHE_PATH."""
+        name = os.getenv("SUGGESTION_PROVIDER", "google").lower()
+        if name not in PROVIDERS:
+            raise ValueError(f"Unknown SUGGESTION_PROVIDER '{name}' (choose from {', '.join(PROVIDERS)})")
+        cache = None
+        if os.getenv("SUGGESTION_CACHE", "on").lower() not in ("0", "off", "false", "no"):
+            cache = LLMCache(os.getenv("SUGGESTION_CACHE_PATH", ".cache/suggestions.sqlite3"),
+                             max_bytes=int(float(os.getenv("SUGGESTION_CACHE_MAX_MB", "64")) * 1024 * 1024))
+        return cls(PROVIDERS[name](), cache=cache, workers=int(os.getenv("SUGGESTION_WORKERS", "4")))
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self.stats[key] += n
+
+    def _key(self, text, target, source):
+        return LLMCache.make_key(provider=self.provider.name, source=source, target=target, text=text)
+
+    def _claim(self, keys):
+        """
+        Splits keys into (futures to wait on, futures this caller must fill).
+        Keys already in flight are shared; the others are registered as in flight.
+        """
+        waiting, owned = {}, {}
+        with self._lock:
+            for key in keys:
+                future = self._inflight.get(key)
+                if future is not None:
+                    waiting[key] = future
+                    self.stats["deduplicated"] += 1
+                else:
+                    owned[key] = self._inflight[key] = Future()
+        return waiting, owned
+
+    def _release(self, key, future, result=None, error=None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _cached(self, key):
+        if self.cache is None:
+            return None
+        value = self.cache.get(key)
+        if value is not None:
+            self._count("cache_hits")
+        return value
+
+    def suggest(self, text, target, source="auto"):
+        """Returns (suggestion, cached), where cached is True when no backend call was made."""
+        self._count("requests")
+        key = self._key(text, target, source)
+        value = self._cached(key)
+        if value is not None:
+            return value, True
+        waiting, owned = self._claim([key])
+        if key in waiting:
+            return waiting[key].result(), True
+        self._run([(key, text)], target, source, owned)
+        return owned[key].result(), False
+
+    def _run(self, items, target, source, owned):
+        """Translates [(key, text), ...] with one translate_many call and settles their futures."""
+        texts = [text for _, text in items]
+        try:
+            results = self.provider.translate_many(texts, target, source) if len(texts) > 1 \
+                else [self.provider.translate(texts[0], target, source)]
+            if len(results) != len(texts):
+                raise RuntimeError(f"{self.provider.name} returned {len(results)} results for {len(texts)} texts")
+        except Exception as e:
+            self._count("errors", len(items))
+            for key, _ in items:
+                self._release(key, owned[key], error=e)
+            return
+        self._count("translated", len(items))
+        for (key, _), result in zip(items, results):
+            if self.cache is not None and result:
+                self.cache.put(key, result)
+            self._release(key, owned[key], result=result)
+
+    def prefetch(self, texts, target, source="auto"):
+        """
+        Starts translating the texts that are neither cached nor in flight, in the background.
+        Returns {"cached": n, "in_flight": n, "queued": n}.
+        """
+        counts = {"cached": 0, "in_flight": 0, "queued": 0}
+        missing = {}
+        for text in dict.fromkeys(t for t in texts if t and t.strip()):
+            key = self._key(text, target, source)
+            if self.cache is not None and self.cache.get(key) is not None:
+                counts["cached"] += 1
+            else:
+                missing[key] = text
+        waiting, owned = self._claim(list(missing))
+        counts["in_flight"] = len(waiting)
+        counts["queued"] = len(owned)
+        items = [(key, missing[key]) for key in owned]
+        size = max(1, self.provider.batch_size)
+        for i in range(0, len(items), size):
+            self._executor.submit(self._run, items[i:i + size], target, source, owned)
+        return counts
+
+    def stats_snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, in_flight=len(self._inflight))
+        stats["provider"] = self.provider.name
+        if self.cache is not None:
+            stats["cache_entries"] = self.cache.stats()["entries"]
+        return stats
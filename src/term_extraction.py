@@ -0,0 +1,141 @@
+import json
+from collections import Counter
+
+# Common nouns/pronouns the LLM keeps proposing as "proper nouns" (Python side is more reliable than the prompt)
+BLOCKLIST = {"村", "町", "道", "街", "都市", "王国", "帝国", "世界", "人間", "彼", "彼女", "自分",
+             "今日", "昨日", "明日", "時間", "場所", "理由", "意味", "言葉", "名前", "ピラミッド", "ミイラ"}
+
+
+def parse_terms_json(raw, src_lang="Japanese", tgt_lang="Traditional Chinese"):
+    """
+    Parses a term extraction response into a list of (source, target) pairs.
+    Accepts markdown-fenced JSON and the layouts models return in practice:
+    {"terms": [...]}, {"glossary_terms": [...]} or a flat {source: target} dict.
+    Raises ValueError if the response is not JSON.
+    """
+    clean_json = (raw or "").strip()
+    if clean_json.startswith("```"):
+        lines = clean_json.split('\n')
+        # Remove first line if it is ``` or ```json
+        if lines[0].strip().startswith("```"):
+            lines = lines[1:]
+        # Remove last line if it is ```
+        if lines and lines[-1].strip() == "```":
+            lines = lines[:-1]
+        clean_json = "\n".join(lines).strip()
+    data = json.loads(clean_json)
+
+    # Helper to normalize keys
+    def get_kv(item):
+        if not isinstance(item, dict):
+            return None, None
+        k = item.get("source") or item.get("jp") or item.get("gloss_term_jp") or item.get(src_lang) or item.get("Japanese")
+        v = item.get("target") or item.get("zh") or item.get("gloss_term_zh") or item.get(tgt_lang) or item.get("Chinese")
+        return k, v
+
+    pairs = []
+    if not isinstance(data, dict):
+        return pairs
+    items = data.get("terms") if isinstance(data.get("terms"), list) else data.get("glossary_terms")
+    if isinstance(items, list):
+        for item in items:
+            k, v = get_kv(item)
+            if isinstance(k, str) and isinstance(v, str) and k.strip() and v.strip():
+                pairs.append((k.strip(), v.strip()))
+    else:
+        # Flat dictionary (Fallback); block lists/dicts to prevent pollution
+        for k, v in data.items():
+            if k not in ("terms", "glossary_terms") and isinstance(v, str) and v.strip():
+                pairs.append((k.strip(), v.strip()))
+    return pairs
+
+
+def is_valid_term(term, text):
+    """Filters hallucinated and overly generic terms: the term must occur in the text it came from."""
+    if term not in text:
+        return False
+    if len(term) > 20 or len(term) <= 1:
+        return False
+    return term not in BLOCKLIST
+
+
+def split_windows(text, window_chars=2500, overlap_chars=200):
+    """
+    Splits text into windows of whole lines, each at most window_chars long
+    (a single longer line is cut). Consecutive windows share up to overlap_chars
+    of trailing lines, so a term at a boundary is seen whole at least once.
+    """
+    lines = [l for l in text.split('\n') if l.strip()]
+    pieces = []
+    for line in lines:
+        while len(line) > window_chars:
+            pieces.append(line[:window_chars])
+            line = line[window_chars - overlap_chars:]
+        pieces.append(line)
+
+    windows = []
+    start = 0
+    while start < len(pieces):
+        end = start
+        size = 0
+        while end < len(pieces) and (end == start or size + len(pieces[end]) + 1 <= window_chars):
+            size += len(pieces[end]) + 1
+            end += 1
+        windows.append("\n".join(pieces[start:end]))
+        if end >= len(pieces):
+            break
+        # Step back over trailing lines for the overlap, but always move forward
+        back = end
+        carried = 0
+        while back - 1 > start and carried + len(pieces[back - 1]) + 1 <= overlap_chars:
+            back -= 1
+            carried += len(pieces[back]) + 1
+        start = back
+    return windows
+
+
+class TermVotes:
+    """
+    Aggregates term proposals from many windows.
+    Each window votes once per (term, target); the glossary keeps the target with
+    the most votes (ties go to the first one proposed) instead of the last one seen.
+    """
+
+    def __init__(self):
+        self.targets = {}  # term -> Counter(target -> votes)
+
+    def add(self, pairs):
+        seen = set()
+        for term, target in pairs:
+            if (term, target) in seen:
+                continue
+            seen.add((term, target))
+            self.targets.setdefault(term, Counter())[target] += 1
+
+    def count(self, term):
+        """Number of windows that proposed the term, whatever the target."""
+        return sum(self.targets.get(term, {}).values())
+
+    def glossary(self, min_votes=1):
+        """{term: majority target} for terms proposed by at least min_votes windows."""
+        result = {}
+        for term, counter in self.targets.items():
+            if sum(counter.values()) >= min_votes:
+                result[term] = counter.most_common(1)[0][0]
+        return result
+
+    def conflicts(self):
+        """Terms with more than one proposed target: {term: [(target, votes), ...]}, most votes first."""
+        return {term: counter.most_common() for term, counter in self.targets.items() if len(counter) > 1}
+
+    def __len__(self):
+        return len(self.targets)
+
+
+def print_vote_summary(votes, limit=10):
+    conflicts = votes.conflicts()
+    if not conflicts:
+        return
+    print(f"{len(conflicts)} terms had conflicting targets; kept the majority:")
+    for term, options in sorted(conflicts.items(), key=lambda kv: -sum(v for _, v in kv[1]))[:limit]:
+        print(f"  {term}: " + ", ".join(f"{t} ({n})" for t, n in options))
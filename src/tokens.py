@@ -0,0 +1,134 @@
+import copy
+import math
+import os
+import re
+import threading
+
+# CJK ideographs, kana and full-width punctuation are roughly one token each
+# on Qwen-style tokenizers; everything else averages about four characters per token.
+CJK_RE = re.compile(r'[　-ヿ㐀-䶿一-鿿豈-﫿＀-￯]')
+
+# Chat template framing per message (role markers, separators) and for the reply header
+MESSAGE_OVERHEAD = 4
+REPLY_OVERHEAD = 3
+
+
+def estimate_tokens(text):
+    """Cheap token estimate that does not need the model's tokenizer."""
+    if not text:
+        return 0
+    cjk = len(CJK_RE.findall(text))
+    other = len(text) - cjk
+    return cjk + (other + 3) // 4
+
+
+class TokenCounter:
+    """
+    Counts tokens for one model.
+    Uses the model's own tokenizer when transformers is installed and the tokenizer
+    is available locally (TOKENIZER_PATH, or the model name in the Hugging Face cache);
+    nothing is downloaded. Otherwise falls back to estimate_tokens(), scaled by a factor
+    that calibrate() keeps in line with the prompt token counts the server reports.
+
+    Fast tokenizers cannot be used by several threads at once, so each thread works on
+    its own copy of the loaded tokenizer and counting never waits on other threads.
+    """
+
+    def __init__(self, model=None, tokenizer_path=None):
+        self.model = model
+        self.tokenizer_path = tokenizer_path or os.getenv("TOKENIZER_PATH") or model
+        self.scale = 1.0
+        self._tokenizer = None
+        self._loaded = False
+        self._local = threading.local()
+        # Guards loading, copying the tokenizer for a new thread and the calibration scale
+        self._lock = threading.Lock()
+
+    def _get_tokenizer(self):
+        if self._loaded:
+            return self._tokenizer
+        with self._lock:
+            if not self._loaded:
+                self._tokenizer = self._load()
+                self._loaded = True
+        return self._tokenizer
+
+    def _load(self):
+        if not self.tokenizer_path:
+            return None
+        try:
+            from transformers import AutoTokenizer
+        except ImportError:
+            return None
+        try:
+            return AutoTokenizer.from_pretrained(self.tokenizer_path, local_files_only=True)
+        except Exception as e:
+            print(f"Tokenizer for {self.tokenizer_path} not available locally ({type(e).__name__}); estimating token counts.")
+            return None
+
+    @property
+    def exact(self):
+        """True when counts come from the model's tokenizer."""
+        return self._get_tokenizer() is not None
+
+    def _thread_tokenizer(self):
+        """This thread's copy of the tokenizer (the loaded one is only ever copied, never used)."""
+        tokenizer = getattr(self._local, "tokenizer", None)
+        if tokenizer is None:
+            with self._lock:
+                tokenizer = self._local.tokenizer = copy.deepcopy(self._tokenizer)
+        return tokenizer
+
+    def _encode(self, text):
+        return self._thread_tokenizer().encode(text, add_special_tokens=False)
+
+    def count(self, text):
+        if not text:
+            return 0
+        if self._get_tokenizer() is not None:
+            return len(self._encode(text))
+        return math.ceil(estimate_tokens(text) * self.scale)
+
+    def count_messages(self, messages):
+        """Prompt tokens of a chat request, including the chat template framing."""
+        tokenizer = self._get_tokenizer()
+        if tokenizer is not None and getattr(tokenizer, "chat_template", None):
+            try:
+                return len(self._thread_tokenizer().apply_chat_template(messages, tokenize=True, add_generation_prompt=True))
+            except Exception:
+                pass
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+
+    def truncate(self, text, max_tokens):
+        """Returns (text cut to at most max_tokens, whether it was cut)."""
+        if max_tokens <= 0:
+            return "", bool(text)
+        if self.count(text) <= max_tokens:
+            return text, False
+        if self._get_tokenizer() is not None:
+            ids = self._encode(text)[:max_tokens]
+            return self._thread_tokenizer().decode(ids), True
+        # Binary search for the longest prefix that fits
+        lo, hi = 0, len(text)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        return text[:lo], True
+
+    def calibrate(self, messages, actual_prompt_tokens):
+        """
+        Adjusts the heuristic's scale towards a prompt token count reported by the server.
+        No-op with a real tokenizer.
+        """
+        if not actual_prompt_tokens or self._get_tokenizer() is not None:
+            return
+        estimated = sum(estimate_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages) + REPLY_OVERHEAD
+        if estimated <= 0:
+            return
+        observed = actual_prompt_tokens / estimated
+        # Moving average, kept in a sane range so one odd response cannot skew budgets
+        with self._lock:
+            self.scale = min(2.0, max(0.5, 0.9 * self.scale + 0.1 * observed))
@@ -1,10 +1,45 @@
+import hashlib
 import os
-from bs4 import BeautifulSoup, NavigableString
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from bs4 import BeautifulSoup
 from tqdm import tqdm
-from src.epub_handler import load_epub, save_epub, get_chapter_items
-from src.llm_client import LLMClient
+from src.extraction import extract_book, file_hash
+from src.glossary_matcher import glossary_changed
+from src.segment_packer import SegmentPacker, format_pack_stats
+from src.term_extraction import TermVotes, is_valid_term, parse_terms_json, print_vote_summary, split_windows
 import json
 
+class SessionCheckpoint:
+    """
+    Buffers translated segments and writes them to a ReviewManager session in one
+    transaction every `interval` seconds or `size` segments, whichever comes first.
+    """
+
+    def __init__(self, manager, interval=10.0, size=200):
+        self.manager = manager
+        self.interval = interval
+        self.size = size
+        self.pending = {}
+        self.written = 0
+        self.flushes = 0
+        self.last_flush = time.monotonic()
+
+    def add(self, segments):
+        for seg in segments:
+            self.pending[seg["id"]] = seg["zh"]
+        if len(self.pending) >= self.size or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        self.written += self.manager.fill_segment_translations(self.pending)
+        self.flushes += 1
+        self.pending = {}
+
+
 class Translator:
     def __init__(self, llm_client, glossary_path=None):
         self.llm = llm_client
@@ -14,99 +49,39 @@ class Translator:
                 self.glossary = json.load(f)
         self.glossary_path = glossary_path
 
-    def extract_terms_from_epub(self, input_path, src_lang="Japanese", tgt_lang="Traditional Chinese", update_existing=True):
+    def extract_terms_from_epub(self, input_path, src_lang="Japanese", tgt_lang="Traditional Chinese", update_existing=True, concurrency=1, window_chars=2500, min_votes=1):
         """
-        Scans values to find new terms and updates the glossary file.
-        Now allows scanning the full book or a large subset.
+        Scans the full text of every chapter for new terms and updates the glossary file.
+        Chapters are cut into overlapping windows of window_chars that are sent to the LLM
+        concurrently; proposals are aggregated by vote, so a term keeps its most common
+        target across the book instead of whichever chapter came last.
         """
-        book = load_epub(input_path)
-        items = get_chapter_items(book)
-        
-        print(f"Scanning {len(items)} chapters in {input_path} for new terms ({src_lang} -> {tgt_lang})...")
-        
-        new_terms_map = {}
-        # We can scan more now since it's a dedicated step
-        for item in tqdm(items):
-            soup = BeautifulSoup(item.get_content(), 'html.parser')
-            text = soup.get_text()
-            
-            # Skip very short texts
-            if len(text) < 200:
-                continue
-                
-            # Inspect first 5000 chars (increased from 3000)
-            chunk_to_analyze = text[:5000]
-            
-            # Optimization: Don't pass the HUGE existing glossary to the LLM prompt.
-            # It wastes tokens and might confuse the model. 
-            # We will filter out known terms in Python AFTER extraction.
-            terms_json = self.llm.extract_new_terms(chunk_to_analyze, src_lang, tgt_lang) 
+        chapters = extract_book(input_path)
+        windows = self.term_windows(chapters, window_chars)
+        print(f"Scanning {len(chapters)} chapters ({len(windows)} windows) in {input_path} for new terms ({src_lang} -> {tgt_lang})...")
 
-            try:
-                # Clean up potential markdown formatting
-                clean_json = terms_json.strip()
-                if clean_json.startswith("```"):
-                    lines = clean_json.split('\n')
-                    # Remove first line if it is ``` or ```json
-                    if lines[0].strip().startswith("```"):
-                        lines = lines[1:]
-                    # Remove last line if it is ```
-                    if lines and lines[-1].strip() == "```":
-                        lines = lines[:-1]
-                    clean_json = "\n".join(lines).strip()
-                
-                data = json.loads(clean_json)
-                
-                # Handle new format: {"terms": [{"jp": "...", "zh": "..."}]}
-                raw_terms = {}
-                
-                # Helper to normalize keys
-                def get_kv(item):
-                    # Try specific generic keys first, then language specific
-                    k = item.get("source") or item.get("jp") or item.get(src_lang) or item.get("Japanese")
-                    v = item.get("target") or item.get("zh") or item.get(tgt_lang) or item.get("Chinese")
-                    return k, v
-
-                if "terms" in data and isinstance(data["terms"], list):
-                    for item in data["terms"]:
-                        k, v = get_kv(item)
-                        if k and v: raw_terms[k] = v
-                elif "glossary_terms" in data and isinstance(data["glossary_terms"], list):
-                    for item in data["glossary_terms"]:
-                        k, v = get_kv(item)
-                        if k and v: raw_terms[k] = v
-                else:
-                    # Fallback
-                    if isinstance(data, dict):
-                         for k, v in data.items():
-                             if k not in ["terms", "glossary_terms"] and isinstance(v, str):
-                                 raw_terms[k] = v
-
-                # Filter invalid terms
-                valid_data = {}
-                blocklist = ["村", "町", "道", "街", "都市", "王国", "帝国", "世界", "人間", "彼", "彼女", "自分", 
-                             "今日", "昨日", "明日", "時間", "場所", "理由", "意味", "言葉", "名前", "ピラミッド", "ミイラ"]
-
-                for k, v in raw_terms.items():
-                    if k in self.glossary: continue # Filter strictly here
-                    if k not in chunk_to_analyze: continue
-                    if len(k) > 20: continue
-                    if len(k) <= 1: continue
-                    if k in blocklist: continue
-                    valid_data[k] = v
-
-                if valid_data:
-                    new_terms_map.update(valid_data)
-                    print(f"DEBUG: Found {len(valid_data)} terms in chapter.") 
-            except Exception as e:
-                print(f"DEBUG: JSON Parse Error: {e}")
-                print(f"DEBUG: Raw Output: {terms_json[:500]}...")
-                pass
+        concurrency = max(1, int(concurrency or 1))
+        results = [None] * len(windows)
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = {pool.submit(self.scan_terms, w, src_lang, tgt_lang): i for i, w in enumerate(windows)}
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Scanning"):
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    print(f"Term Extraction Error: {e}")
+
+        # Votes are counted in book order, so ties resolve the same way on every run
+        votes = TermVotes()
+        for pairs in results:
+            votes.add(pairs or [])
+        print_vote_summary(votes)
+        new_terms_map = votes.glossary(min_votes=min_votes)
         
         if new_terms_map:
             print(f"Found {len(new_terms_map)} new terms.")
             if update_existing:
                 self.glossary.update(new_terms_map)
+                glossary_changed(self.glossary)
                 if self.glossary_path:
                     with open(self.glossary_path, 'w', encoding='utf-8') as f:
                         json.dump(self.glossary, f, ensure_ascii=False, indent=2)
@@ -116,76 +91,228 @@ class Translator:
             print("No new terms found.")
             return {}
 
-    def prepare_review_session(self, input_path, work_dir, src_lang="Japanese", tgt_lang="Traditional Chinese", auto_translate=False):
+    @staticmethod
+    def term_windows(chapters, window_chars=2500):
+        """Term extraction windows over the chapters of extract_book()."""
+        # Skip very short texts (title pages, illustrations)
+        return [w for chapter in chapters if len(chapter["text"]) >= 200
+                for w in split_windows(chapter["text"], window_chars)]
+
+    def scan_terms(self, window, src_lang="Japanese", tgt_lang="Traditional Chinese"):
+        """One extract_new_terms request; returns the (term, target) pairs not in the glossary yet."""
+        # Optimization: Don't pass the HUGE existing glossary to the LLM prompt.
+        # It wastes tokens and might confuse the model.
+        # We will filter out known terms in Python AFTER extraction.
+        terms_json = self.llm.extract_new_terms(window, src_lang, tgt_lang)
+        try:
+            pairs = parse_terms_json(terms_json, src_lang, tgt_lang)
+        except Exception as e:
+            print(f"DEBUG: JSON Parse Error: {e}")
+            print(f"DEBUG: Raw Output: {(terms_json or '')[:500]}...")
+            return []
+        return [(k, v) for k, v in pairs if k not in self.glossary and is_valid_term(k, window)]
+
+    def prepare_review_session(self, input_path, work_dir, src_lang="Japanese", tgt_lang="Traditional Chinese", auto_translate=False, concurrency=1, batch=True, resume=False):
         """
         Extracts text from EPUB and initializes a review session.
-        Returns the number of segments created.
+        concurrency: max number of LLM requests in flight during auto-translation.
+        batch: pack segments into token-budgeted translate_batch calls instead of one call per segment.
+        resume: keep an existing session of the same EPUB in work_dir and only translate
+                the segments that have no translation yet.
+        The session is created before auto-translation starts and translations are
+        checkpointed into it as they arrive, so an interrupted run loses little work.
+        Returns the number of segments in the session.
         """
         print(f"Preparing review session for {input_path} ({src_lang} -> {tgt_lang})...")
-        book = load_epub(input_path)
-        items = get_chapter_items(book)
-        
         from src.review_manager import ReviewManager
         import uuid
-        
-        segments = []
-        
-        for item in items:
-            # We focus on main content
-            if 'p-' not in item.get_name(): continue
-            
-            raw_html = item.get_content().decode('utf-8')
-            # Use XML parser to ensure valid XHTML output (e.g. self-closing tags) which is required for EPUBs
-            # 'html.parser' produces HTML5 void tags (e.g. <img>) which breaks Calibre
-            soup = BeautifulSoup(raw_html, 'xml')
+
+        # Initialize Manager
+        if not os.path.exists(work_dir):
+            os.makedirs(work_dir)
+        mgr = ReviewManager(work_dir)
+        source_hash = file_hash(input_path)
+
+        if resume and mgr.has_session():
+            if mgr.get_meta("source_hash") not in (None, source_hash):
+                raise ValueError(f"The session in {work_dir} was prepared from a different EPUB; run without --resume to replace it")
+            segments = mgr.get_all_segments()
+            done = sum(1 for seg in segments if seg["zh"])
+            print(f"Resuming session in {work_dir}: {done} of {len(segments)} segments already translated")
+        else:
+            if resume:
+                print(f"No session to resume in {work_dir}, creating a new one")
+            chapters = extract_book(input_path)
+            segments = []
             
-            # Extract paragraphs to Translate
-            for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                if p.find(['p', 'div', 'blockquote']): continue
-                
-                text = p.get_text().strip()
-                if not text: continue
+            for chapter in chapters:
+                # We focus on main content
+                if 'p-' not in chapter["name"]: continue
                 
-                # Create a segment
-                seg = {
-                    "id": str(uuid.uuid4()),
-                    "chapter": item.get_name(),
-                    "jp": text,
-                    "zh": "", 
-                    "status": "pending"
-                }
-                segments.append(seg)
+                # Paragraphs to Translate (leaf <p>/<h1-6> blocks, the same ones assemble_epub replaces)
+                for text in chapter["segments"]:
+                    # Create a segment
+                    seg = {
+                        "id": str(uuid.uuid4()),
+                        "chapter": chapter["name"],
+                        "jp": text,
+                        "zh": "", 
+                        "status": "pending"
+                    }
+                    segments.append(seg)
+
+            # Created before translating, so every checkpoint has a session to go into
+            mgr.create_session(os.path.basename(input_path), segments, self.glossary, src_lang=src_lang, tgt_lang=tgt_lang,
+                               meta={"source_hash": source_hash})
+            print(f"Session created with {len(segments)} segments in {work_dir}")
 
         # Auto-Translate if requested
         if auto_translate:
-            print(f"Auto-translating {len(segments)} segments with {self.llm.model}...")
-            # We use single translation for robustness and to reuse the prompt logic
-            # This might be slow but it's safe and interactive (users see progress bar)
-            for seg in tqdm(segments, desc="Translating"):
+            pending = [seg for seg in segments if not seg["zh"] and seg["status"] != "approved"]
+            print(f"Auto-translating {len(pending)} segments with {self.llm.model} (concurrency={concurrency})...")
+            checkpoint = SessionCheckpoint(mgr)
+            try:
+                if batch:
+                    self.translate_segments_batched(pending, src_lang, tgt_lang, concurrency, on_translated=checkpoint.add)
+                else:
+                    self.translate_segments(pending, src_lang, tgt_lang, concurrency, on_translated=checkpoint.add)
+            finally:
+                checkpoint.flush()
+            print(f"Saved {checkpoint.written} translations to the session in {checkpoint.flushes} checkpoints")
+
+        return len(segments)
+
+    def translate_segments(self, segments, src_lang="Japanese", tgt_lang="Traditional Chinese", concurrency=1, on_translated=None):
+        """
+        Fills seg['zh'] for every segment using translate_single.
+        Up to `concurrency` requests are kept in flight so vLLM's continuous batching
+        has work to schedule. Results are written back onto their own segment, so the
+        output order never depends on completion order, and a failing segment only
+        leaves its own 'zh' empty.
+        on_translated: called (from this thread) with each list of newly translated segments.
+        Returns the number of segments that received a translation.
+        """
+        concurrency = max(1, int(concurrency or 1))
+        translated = 0
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = {
+            pool.submit(self.llm.translate_single, seg['jp'], self.glossary, src_lang, tgt_lang): seg
+            for seg in segments
+        }
+        handled = set()
+
+        def collect(future):
+            nonlocal translated
+            handled.add(future)
+            seg = futures[future]
+            try:
+                trans = future.result()
+            except Exception as e:
+                print(f"Error translating segment {seg['id']}: {e}")
+                return
+            if trans:
+                # We keep status as 'pending' so the user still has to 'Approve' it.
+                seg['zh'] = trans
+                translated += 1
+                if on_translated:
+                    on_translated([seg])
+
+        try:
+            for future in tqdm(as_completed(futures), total=len(futures), desc="Translating"):
+                collect(future)
+        except BaseException:
+            self._interrupt(pool, futures, handled, collect)
+            raise
+        pool.shutdown()
+        return translated
+
+    def translate_segments_batched(self, segments, src_lang="Japanese", tgt_lang="Traditional Chinese", concurrency=1, packer=None, on_translated=None):
+        """
+        Fills seg['zh'] by sending token-budgeted batches of consecutive same-chapter
+        segments through translate_batch, so the system prompt and glossary are paid
+        once per batch instead of once per paragraph.
+        on_translated: called (from this thread) with each list of newly translated segments.
+        Returns the number of segments that received a translation.
+        """
+        packer = packer or SegmentPacker(max_model_len=self.llm.max_model_len, count_tokens=self.llm.tokens.count)
+        batches, stats = packer.pack(segments)
+        print(format_pack_stats(stats))
+
+        concurrency = max(1, int(concurrency or 1))
+        translated = 0
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = {pool.submit(self.translate_pack, batch, src_lang, tgt_lang): batch for batch in batches}
+        handled = set()
+
+        with tqdm(total=len(segments), desc="Translating") as progress:
+            def collect(future):
+                nonlocal translated
+                handled.add(future)
+                batch = futures[future]
+                progress.update(len(batch))
                 try:
-                    # Reuse the same logic as the UI
-                    trans = self.llm.translate_single(seg['jp'], self.glossary, src_lang, tgt_lang)
-                    if trans:
-                        seg['zh'] = trans
-                        # We keep status as 'pending' so user still has to 'Approve' it? 
-                        # Or maybe 'draft'? For now 'pending' implies it needs review.
+                    results = future.result()
                 except Exception as e:
-                    print(f"Error translating segment {seg['id']}: {e}")
+                    print(f"Error translating batch starting at segment {batch[0]['id']}: {e}")
+                    return
+                done = self.apply_translations(batch, results)
+                translated += len(done)
+                if on_translated and done:
+                    on_translated(done)
 
-        # Initialize Manager
-        if not os.path.exists(work_dir):
-            os.makedirs(work_dir)
-            
-        mgr = ReviewManager(work_dir)
-        mgr.create_session(os.path.basename(input_path), segments, self.glossary, src_lang=src_lang, tgt_lang=tgt_lang)
-        
-        print(f"Session created with {len(segments)} segments in {work_dir}")
-        return len(segments)
+            try:
+                for future in as_completed(futures):
+                    collect(future)
+            except BaseException:
+                self._interrupt(pool, futures, handled, collect)
+                raise
+        pool.shutdown()
+        return translated
+
+    @staticmethod
+    def _interrupt(pool, futures, handled, collect):
+        """
+        Ctrl-C (or any error) while waiting on the pool: drops the requests not started yet
+        instead of waiting for all of them, and collects the results that already came back
+        so the caller's checkpoint can save them before the exception propagates.
+        """
+        pool.shutdown(wait=False, cancel_futures=True)
+        cancelled = sum(1 for f in futures if f.cancelled())
+        finished = [f for f in futures if f not in handled and f.done() and not f.cancelled()]
+        print(f"Interrupted: {cancelled} queued requests cancelled, keeping {len(finished)} finished ones")
+        for future in finished:
+            collect(future)
 
-    def assemble_epub(self, original_epub_path, session_dir, output_path):
+    def translate_pack(self, batch, src_lang="Japanese", tgt_lang="Traditional Chinese", glossary=None, use_cache=True):
+        """
+        Translates one packed batch of segments; returns one translation (or None) per segment.
+        Single-segment batches go through translate_single (no JSON overhead).
+        glossary: defaults to self.glossary.
+        use_cache=False: ask the model again rather than reuse cached answers.
+        """
+        glossary = self.glossary if glossary is None else glossary
+        if len(batch) == 1:
+            return [self.llm.translate_single(batch[0]['jp'], glossary, src_lang, tgt_lang, use_cache=use_cache)]
+        return self.llm.translate_batch([seg['jp'] for seg in batch], glossary, src_lang, tgt_lang, use_cache=use_cache)
+
+    @staticmethod
+    def apply_translations(batch, results):
+        """Writes usable translations onto their segments; returns the segments that got one."""
+        done = []
+        for seg, trans in zip(batch, results or []):
+            if isinstance(trans, str) and trans.strip():
+                seg['zh'] = trans.strip()
+                done.append(seg)
+        return done
+
+    def assemble_epub(self, original_epub_path, session_dir, output_path, workers=None, incremental=True):
         """
         Reconstructs the EPUB using direct ZipFile manipulation to ensure
         files that are not translated remain 100% bit-identical (preserving SVGs, covers, etc).
+        Translated chapters are parsed and rewritten in a process pool (workers, default: CPU count);
+        results are written back in the original entry order.
+        incremental: reuse chapters rendered by a previous export from session_dir/build_cache
+        when neither the source chapter nor its segments changed (False re-renders everything).
         """
         print(f"Assembling EPUB from {session_dir}...")
         import zipfile
@@ -193,8 +320,7 @@ class Translator:
         # Load Session Data
         from src.review_manager import ReviewManager
         mgr = ReviewManager(session_dir)
-        session_data = mgr.session_data
-        segments = session_data.get("segments", [])
+        segments = mgr.get_all_segments()
         
         # Create lookup: filename -> list of segments
         # Note: session segments use 'chapter' which comes from item.get_name()
@@ -210,86 +336,172 @@ class Translator:
 
         with zipfile.ZipFile(original_epub_path, 'r') as in_zip, \
              zipfile.ZipFile(output_path, 'w', compression=zipfile.ZIP_DEFLATED) as out_zip:
-            
-            # Iterate every file in the original EPUB
+
+            # Decide per entry: copy as-is, or render the translated chapter
+            plan = []
             for info in in_zip.infolist():
                 filename = info.filename
-                
-                # Check if we should modify this file
-                # We try to match the filename. ebooklib names usually match zip paths.
-                # E.g. session "xhtml/p-001.xhtml" vs zip "OEBPS/xhtml/p-001.xhtml"
-                # We'll check if the session chapter name ends with the filename or vice versa
-                
-                target_segments = None
-                matched_chap_name = None
-                
-                # Exact match first
-                if filename in chapter_map:
-                    target_segments = chapter_map[filename]
-                    matched_chap_name = filename
-                else:
-                    # Fuzzy match: duplicate/suffix check
-                    # Often ebooklib strips 'OEBPS/' or similar.
-                    # We check if any chapter key is a suffix of the filename
-                    for chap_name in chapter_map:
-                         if filename.endswith(chap_name):
-                             # Ambiguity check: if we have "a/b.xhtml" and "b.xhtml", ending with "b.xhtml" is risky.
-                             # But in EPUB structure usually unique enough.
-                             target_segments = chapter_map[chap_name]
-                             matched_chap_name = chap_name
-                             break
-                
+                if filename == "mimetype":
+                    continue
+                matched_chap_name = resolve_chapter(filename, chapter_map)
+                target_segments = chapter_map.get(matched_chap_name) if matched_chap_name else None
+
                 # Logic: If found segments, verify they have translations
-                valid_modification = False
-                if target_segments:
-                     # Check for actual content
-                     if any(s.get("zh") and s["zh"].strip() for s in target_segments):
-                         valid_modification = True
-                     else:
-                         print(f"Skipping {filename} (Matched {matched_chap_name} but no translations)")
-                
-                if valid_modification:
-                    # Apply Translation
-                    # print(f"Translating {filename}...")
-                    content = in_zip.read(filename).decode('utf-8')
-                    
-                    # Parse
-                    soup = BeautifulSoup(content, 'xml')
-                    
-                    seg_idx = 0
-                    modified = False
-                    
-                    # We only traverse text nodes, same strategy as prepare
-                    for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
-                        if p.find(['p', 'div', 'blockquote']): continue
-                        text = p.get_text().strip()
-                        if not text: continue
-                        
-                        if seg_idx < len(target_segments):
-                            seg = target_segments[seg_idx]
-                            
-                            if seg["jp"] == text:
-                                if seg["zh"]:
-                                    p.string = seg["zh"]
-                                    modified = True
-                                seg_idx += 1
-                            else:
-                                pass # Mismatch or skip
-
-                    if modified:
-                        # Write modified content
-                        # Use minimal xml formatter
-                        new_content = soup.encode(encoding='utf-8', formatter='minimal')
+                if target_segments and not any(s.get("zh") and s["zh"].strip() for s in target_segments):
+                    print(f"Skipping {filename} (Matched {matched_chap_name} but no translations)")
+                    target_segments = None
+                plan.append((info, target_segments))
+
+            # The OCF spec requires 'mimetype' to be the first entry, stored uncompressed
+            if "mimetype" in in_zip.namelist():
+                out_zip.writestr(zipfile.ZipInfo("mimetype"), in_zip.read("mimetype"), compress_type=zipfile.ZIP_STORED)
+
+            # Render only chapters whose build key is not in the cache
+            cache = BuildCache(os.path.join(session_dir, "build_cache"))
+            results = {}
+            entry_keys = {}
+            jobs = []
+            for info, segs in plan:
+                if not segs:
+                    continue
+                pairs = [(s["jp"], s["zh"]) for s in segs]
+                key = entry_keys[info.filename] = BuildCache.chapter_key(info, pairs)
+                if incremental and cache.has(key):
+                    results[key] = cache.get(key)
+                elif key not in results:
+                    results[key] = None
+                    jobs.append((key, in_zip.read(info.filename), pairs))
+            rendered = self._render_chapters([(content, pairs) for _, content, pairs in jobs], workers)
+            for (key, _, _), new_content in zip(jobs, rendered):
+                results[key] = new_content
+                cache.put(key, new_content)
+            print(f"Rendered {len(jobs)} chapter(s), reused {len(entry_keys) - len(jobs)} from build cache.")
+
+            for info, segs in plan:
+                filename = info.filename
+                if segs:
+                    new_content = results[entry_keys[filename]]
+                    if new_content is not None:
                         out_zip.writestr(info, new_content)
                         continue
-                    else:
-                        print(f"File parsed but no text replaced: {filename}")
-                        # Fallback to copy original
-                
+                    print(f"File parsed but no text replaced: {filename}")
+                    # Fallback to copy original
+
                 # Fallback: Copy original byte-for-byte
                 # This preserves cover images, fonts, css, and untranslated text exactly.
                 raw_data = in_zip.read(filename)
                 out_zip.writestr(info, raw_data)
 
+            cache.prune(set(results))
+
         print(f"Assembled EPUB saved to {output_path}")
 
+    @staticmethod
+    def _render_chapters(jobs, workers=None):
+        """Runs render_chapter over (content, pairs) jobs, in a process pool when worthwhile. Keeps order."""
+        workers = workers or os.cpu_count() or 1
+        if workers <= 1 or len(jobs) <= 1:
+            return [render_chapter(content, pairs) for content, pairs in jobs]
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            return list(pool.map(render_chapter, *zip(*jobs)))
+
+
+class BuildCache:
+    """
+    Rendered chapter bytes from previous exports, one file per build key.
+    A key covers the source entry (name, CRC, size), the chapter's (jp, zh) pairs and the
+    renderer version, so a chapter is re-rendered only when one of them changed.
+    """
+    RENDER_VERSION = 1
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def chapter_key(cls, info, pairs):
+        h = hashlib.sha256()
+        h.update(json.dumps([cls.RENDER_VERSION, info.filename, info.CRC, info.file_size, pairs],
+                            ensure_ascii=False).encode('utf-8'))
+        return h.hexdigest()
+
+    def _path(self, key, suffix):
+        return os.path.join(self.cache_dir, key + suffix)
+
+    def has(self, key):
+        return os.path.exists(self._path(key, ".xhtml")) or os.path.exists(self._path(key, ".none"))
+
+    def get(self, key):
+        """Cached bytes, or None if the chapter rendered to 'nothing replaced'."""
+        path = self._path(key, ".xhtml")
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def put(self, key, content):
+        path = self._path(key, ".xhtml" if content is not None else ".none")
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content or b"")
+        os.replace(tmp_path, path)
+
+    def prune(self, keep_keys):
+        """Removes entries not used by the latest build."""
+        for name in os.listdir(self.cache_dir):
+            if name.split(".")[0] not in keep_keys:
+                os.remove(os.path.join(self.cache_dir, name))
+
+
+def resolve_chapter(filename, chapter_map):
+    """
+    Finds the session chapter name for a zip entry.
+    Session names come from ebooklib and are usually relative to the OPF folder
+    (session "xhtml/p-001.xhtml" vs zip "OEBPS/xhtml/p-001.xhtml"), so we look up
+    the full path and then each shorter path suffix, longest first.
+    """
+    if filename in chapter_map:
+        return filename
+    parts = filename.split("/")
+    for i in range(1, len(parts)):
+        suffix = "/".join(parts[i:])
+        if suffix in chapter_map:
+            return suffix
+    return None
+
+
+def render_chapter(content, pairs):
+    """
+    Applies (jp, zh) segment pairs to one XHTML chapter, in document order.
+    Returns the new bytes, or None if nothing was replaced.
+    Module-level so it can run in a worker process.
+    """
+    # Parse
+    soup = BeautifulSoup(content.decode('utf-8'), 'xml')
+
+    seg_idx = 0
+    modified = False
+
+    # We only traverse text nodes, same strategy as prepare
+    for p in soup.find_all(['p', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6']):
+        if p.find(['p', 'div', 'blockquote']): continue
+        text = p.get_text().strip()
+        if not text: continue
+
+        if seg_idx < len(pairs):
+            jp, zh = pairs[seg_idx]
+
+            if jp == text:
+                if zh:
+                    p.string = zh
+                    modified = True
+                seg_idx += 1
+            else:
+                pass # Mismatch or skip
+
+    if not modified:
+        return None
+    # Write modified content
+    # Use minimal xml formatter
+    return soup.encode(encoding='utf-8', formatter='minimal')
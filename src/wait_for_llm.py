@@ -1,38 +1,38 @@
 import time
-import urllib.request
-import urllib.error
 import os
 import sys
 
+# Allow running as script from root or src
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from src.llm_pool import check_endpoint, parse_endpoints
+
 def wait_for_llm():
-    base_url = os.environ.get("LLM_API_URL", "http://vllm:8000/v1")
-    url = f"{base_url}/models"
-    print(f"Checking connectivity to {url}...")
-    
+    urls = parse_endpoints(os.environ.get("LLM_API_URL", "http://vllm:8000/v1"))
+    api_key = os.environ.get("LLM_API_KEY")
+    # With several replicas, start once a majority answers (LLM_QUORUM overrides)
+    quorum = int(os.environ.get("LLM_QUORUM") or len(urls) // 2 + 1)
+    quorum = max(1, min(quorum, len(urls)))
+    print(f"Checking connectivity to {', '.join(url + '/models' for url in urls)} (need {quorum} of {len(urls)})...")
+
     timeout_minutes = 5
     start_time = time.time()
-    
+
     while True:
-        try:
-            # Set a short timeout for the request itself
-            req = urllib.request.Request(url)
-            api_key = os.environ.get("LLM_API_KEY")
-            if api_key:
-                req.add_header("Authorization", f"Bearer {api_key}")
-                
-            with urllib.request.urlopen(req, timeout=5) as response:
-                if response.status == 200:
-                    print('vLLM is ready!')
-                    return
-        except urllib.error.URLError as e:
-            print(f"Waiting for vLLM... Connection Error: {e.reason}")
-        except Exception as e:
-            print(f"Waiting for vLLM... Unexpected Error: {e}")
-            
+        healthy = 0
+        for url in urls:
+            error = check_endpoint(url, api_key)
+            if error is None:
+                healthy += 1
+            else:
+                print(f"Waiting for vLLM at {url}... {error}")
+        if healthy >= quorum:
+            print(f'vLLM is ready! ({healthy} of {len(urls)} endpoints up)')
+            return
+
         if time.time() - start_time > timeout_minutes * 60:
-            print("Timed out waiting for vLLM to start.")
+            print(f"Timed out waiting for vLLM to start ({healthy} of {len(urls)} endpoints up, need {quorum}).")
             sys.exit(1)
-            
+
         time.sleep(5)
 
 if __name__ == "__main__":
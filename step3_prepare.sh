@@ -18,6 +18,7 @@ echo "Work Dir: $WORK_DIR"
 
 # Optional: Add --auto-translate if you want to pre-translate everything
 # ARGS: --auto-translate
+# Extra arguments are passed through, e.g. ./step3_prepare.sh --resume after an interrupted run
 
 docker run --rm \
   -v $(pwd):/app \
@@ -29,4 +30,6 @@ docker run --rm \
     --work-dir "$WORK_DIR" \
     --src-lang "$SRC_LANG" \
     --tgt-lang "$TGT_LANG" \
-    --auto-translate 
+    --concurrency "${LLM_CONCURRENCY:-8}" \
+    --auto-translate \
+    "$@"
@@ -0,0 +1,33 @@
+#!/bin/bash
+
+if [ -f .env ]; then
+  set -a
+  source .env
+  set +a
+else
+  echo ".env file not found."
+  exit 1
+fi
+
+echo "Building Translator Image..."
+docker build -t ebook-translator . > /dev/null
+
+echo "Running Series Batch: Extract Terms + Prepare + Auto-Translate for every volume..."
+echo "Input Dir: $SERIES_DIR"
+echo "Work Root: $SERIES_WORK_ROOT"
+
+# Re-running the same command resumes: finished volumes are skipped, interrupted ones continue.
+# Extra arguments are passed through, e.g. ./step_batch_series.sh --no-extract
+
+docker run --rm \
+  -v $(pwd):/app \
+  --env-file .env \
+  ebook-translator \
+  python3 src/main.py batch \
+    --input-dir "$SERIES_DIR" \
+    --work-root "$SERIES_WORK_ROOT" \
+    --glossary "$ALIGN_OUTPUT_GLOSSARY" \
+    --src-lang "$SRC_LANG" \
+    --tgt-lang "$TGT_LANG" \
+    --concurrency "${LLM_CONCURRENCY:-8}" \
+    "$@"